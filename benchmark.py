@@ -0,0 +1,228 @@
+import os
+import sys
+import json
+import time
+import argparse
+
+import numpy as np
+
+import columnar
+from lazyroot import rt
+
+# Benchmark of the analysis backends on synthetic inputs. generateFiles writes
+# local trackingNtuple files with the branch layout myMacro.py reads (sim
+# particles from pileup vertices, tracks matched to them with duplicates and
+# fakes, one seed per track) so that the events/s of every backend can be
+# measured, and compared with a previous run, without access to EOS.
+
+defaults = {'pileup'             : 50,    # pp interactions (primary vertices) per event
+            'simsPerVertex'      : 20,    # mean number of sim particles per primary vertex
+            'electronFraction'   : 0.05,  # fraction of sim particles that are electrons
+            'secondaryFraction'  : 0.2,   # fraction of sim particles from secondary vertices
+            'efficiency'         : 0.7,   # probability for a sim particle to have a track
+            'duplicateFraction'  : 0.1,   # probability for a reconstructed particle to have a second track
+            'fakeFraction'       : 0.1,   # fraction of tracks not matched to any sim particle
+            'ecalDrivenFraction' : 0.6,   # probability for the seed of an electron track to be ECAL-driven
+            'nAlgos'             : 7}     # number of seeding algorithms (see myMacro.seedNames)
+
+hadronIds = [211, -211, 321, -321, 2212, -2212, 13, -13, 22]
+
+# One synthetic event, as a dict branch name -> list (or list of lists)
+def generateEvent(rng, config):
+    nPrimary = max(1, rng.poisson(config['pileup']))
+    nSims = max(1, rng.poisson(nPrimary*config['simsPerVertex']))
+
+    isElectron = rng.uniform(size=nSims) < config['electronFraction']
+    pdgId = np.where(isElectron, rng.choice([11, -11], nSims), rng.choice(hadronIds, nSims))
+    pt = np.exp(rng.uniform(np.log(0.5), np.log(200.), nSims))
+    eta = rng.uniform(-3., 3., nSims)
+    phi = rng.uniform(-np.pi, np.pi, nSims)
+
+    # secondary vertices are produced by one of the other sim particles
+    isSecondary = rng.uniform(size=nSims) < config['secondaryFraction']
+    parentVtxIdx = rng.randint(0, nPrimary, nSims)
+    parentVtxIdx[isSecondary] = nPrimary + np.arange(isSecondary.sum())
+    sourceSimIdx = [[] for ivtx in xrange(nPrimary)] + [[int(rng.randint(0, nSims))] for isim in np.nonzero(isSecondary)[0]]
+
+    # tracks: reconstructed sim particles, some twice, plus fakes, in random order
+    reconstructed = np.nonzero(rng.uniform(size=nSims) < config['efficiency'])[0]
+    duplicated = reconstructed[rng.uniform(size=len(reconstructed)) < config['duplicateFraction']]
+    nFakes = int(rng.poisson(config['fakeFraction']*(len(reconstructed)+len(duplicated))))
+    trkSims = np.concatenate([reconstructed, duplicated, np.full(nFakes, -1, dtype=np.int64)])
+    trkSims = trkSims[rng.permutation(len(trkSims))]
+    nTracks = len(trkSims)
+    simTrkIdx = [[] for isim in xrange(nSims)]
+    for itrk, isim in enumerate(trkSims):
+        if isim >= 0: simTrkIdx[isim].append(itrk)
+
+    # one seed per track, in another order
+    trkSeedIdx = rng.permutation(nTracks)
+    seedSims = np.full(nTracks, -1, dtype=np.int64)
+    seedSims[trkSeedIdx] = trkSims
+    seedElectron = (seedSims >= 0) & isElectron[np.maximum(seedSims, 0)]
+    ecalDriven = rng.uniform(size=nTracks) < np.where(seedElectron, config['ecalDrivenFraction'], 0.05)
+
+    return {'sim_px'              : pt*np.cos(phi),
+            'sim_py'              : pt*np.sin(phi),
+            'sim_pz'              : pt*np.sinh(eta),
+            'sim_pdgId'           : pdgId,
+            'sim_parentVtxIdx'    : parentVtxIdx,
+            'sim_trkIdx'          : simTrkIdx,
+            'simvtx_sourceSimIdx' : sourceSimIdx,
+            'trk_seedIdx'         : trkSeedIdx,
+            'trk_simTrkIdx'       : [[int(isim)] if isim >= 0 else [] for isim in trkSims],
+            'see_ecalDriven'      : ecalDriven.astype(np.int16),
+            'see_algoOriginal'    : rng.randint(0, config['nAlgos'], nTracks)}
+
+# C++ types of the branches, as in the trackingNtuple
+branchTypes = {'sim_px'              : 'float',
+               'sim_py'              : 'float',
+               'sim_pz'              : 'float',
+               'sim_pdgId'           : 'int',
+               'sim_parentVtxIdx'    : 'int',
+               'sim_trkIdx'          : 'vector<int>',
+               'simvtx_sourceSimIdx' : 'vector<int>',
+               'trk_seedIdx'         : 'int',
+               'trk_simTrkIdx'       : 'vector<int>',
+               'see_ecalDriven'      : 'short',
+               'see_algoOriginal'    : 'unsigned int'}
+
+def writeFile(path, nEvents, config, seed):
+    rng = np.random.RandomState(seed)
+    outputFile = rt.TFile(path, 'RECREATE')
+    outputFile.mkdir(columnar.treeName.split('/')[0]).cd()
+    tree = rt.TTree(columnar.treeName.split('/')[1], 'synthetic trackingNtuple')
+    vectors = {}
+    for branch, branchType in sorted(branchTypes.iteritems()):
+        vectors[branch] = rt.std.vector(branchType)()
+        tree.Branch(branch, vectors[branch])
+    for ievent in xrange(nEvents):
+        event = generateEvent(rng, config)
+        for branch, vector in vectors.iteritems():
+            vector.clear()
+            if branchTypes[branch].startswith('vector'):
+                for values in event[branch]:
+                    inner = rt.std.vector('int')()
+                    for value in values:
+                        inner.push_back(int(value))
+                    vector.push_back(inner)
+            else:
+                for value in event[branch]:
+                    vector.push_back(value.item())
+        tree.Fill()
+    outputFile.Write()
+    outputFile.Close()
+
+# Write nFiles files of nEvents events to outputDir, unless files written with
+# the same configuration are already there
+def generateFiles(outputDir, nFiles, nEvents, config):
+    if not os.path.isdir(outputDir):
+        os.makedirs(outputDir)
+    description = dict(config, nFiles=nFiles, nEvents=nEvents)
+    paths = [os.path.join(outputDir, 'trackingNtuple_%d.root' % ifile) for ifile in xrange(1, nFiles+1)]
+    configPath = os.path.join(outputDir, 'config.json')
+    if os.path.exists(configPath) and all(os.path.exists(path) for path in paths):
+        with open(configPath) as configFile:
+            if json.load(configFile) == description:
+                return paths
+    for ifile, path in enumerate(paths):
+        print 'Writing %s' % path
+        writeFile(path, nEvents, config, seed=ifile+1)
+    with open(configPath, 'w') as configFile:
+        json.dump(description, configFile, indent=1, sort_keys=True)
+    return paths
+
+def makeChain(inputFiles):
+    chain = rt.TChain(columnar.treeName)
+    for inputFile in inputFiles:
+        chain.Add(inputFile)
+    return chain
+
+# name -> function of (inputFiles, workers, chunkSize) running one backend
+def makeBackends():
+    import myMacro, scheduler
+
+    def bothAnalyses():
+        return [myMacro.EfficiencyAnalysis(), myMacro.SeedAnalysis()]
+
+    return [('seeds-loop',           lambda inputFiles, workers, chunkSize: myMacro.analyzeSeeds(makeChain(inputFiles))),
+            ('efficiency-loop',      lambda inputFiles, workers, chunkSize: myMacro.analyzeECALdrivenEfficiency(makeChain(inputFiles))),
+            ('seeds-columnar',       lambda inputFiles, workers, chunkSize: myMacro.analyzeSeedsColumnar(inputFiles, chunkSize)),
+            ('seeds-rdf',            lambda inputFiles, workers, chunkSize: myMacro.analyzeSeedsRDF(inputFiles, workers)),
+            ('efficiency-columnar',  lambda inputFiles, workers, chunkSize: myMacro.analyzeECALdrivenEfficiencyColumnar(inputFiles, chunkSize)),
+            ('pass-loop',            lambda inputFiles, workers, chunkSize: scheduler.Pass(bothAnalyses()).Run(makeChain(inputFiles))),
+            ('pass-columnar',        lambda inputFiles, workers, chunkSize: scheduler.Pass(bothAnalyses()).RunColumnar(inputFiles, chunkSize)),
+            ('pass-parallel',        lambda inputFiles, workers, chunkSize: scheduler.Pass(bothAnalyses()).RunParallel(inputFiles, workers, 'loop', chunkSize))]
+
+def runBenchmarks(inputFiles, names = None, workers = 2, chunkSize = 10000):
+    nEvents = makeChain(inputFiles).GetEntries()
+    results = {}
+    for name, run in makeBackends():
+        if names is not None and name not in names: continue
+        if 'columnar' in name and columnar.uproot is None:
+            print 'Skipping %s: uproot is not available' % name
+            continue
+        start = time.time()
+        run(inputFiles, workers, chunkSize)
+        elapsed = time.time() - start
+        results[name] = {'seconds' : elapsed, 'events' : nEvents, 'eventsPerSecond' : nEvents/elapsed}
+    return results
+
+# Backends whose events/s dropped by more than tolerance with respect to baseline
+def findRegressions(results, baseline, tolerance):
+    regressions = []
+    for name, result in sorted(results.iteritems()):
+        if name not in baseline: continue
+        ratio = result['eventsPerSecond']/baseline[name]['eventsPerSecond']
+        if ratio < 1. - tolerance:
+            regressions.append((name, ratio))
+    return regressions
+
+def printResults(results, baseline = None):
+    print '%-22s %10s %14s %10s' % ('backend', 'seconds', 'events/s', 'vs base')
+    for name, result in sorted(results.iteritems()):
+        ratio = ''
+        if baseline is not None and name in baseline:
+            ratio = '%.2fx' % (result['eventsPerSecond']/baseline[name]['eventsPerSecond'])
+        print '%-22s %10.2f %14.1f %10s' % (name, result['seconds'], result['eventsPerSecond'], ratio)
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dir', default='benchmark',
+                        help='directory of the synthetic input files')
+    parser.add_argument('--files', type=int, default=4)
+    parser.add_argument('--events', type=int, default=200,
+                        help='events per file')
+    for name, value in sorted(defaults.iteritems()):
+        parser.add_argument('--'+name, type=type(value), default=value)
+    parser.add_argument('--backends', nargs='*', default=None,
+                        help='only run these backends (default: all)')
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--output', default=None,
+                        help='write the results to this JSON file')
+    parser.add_argument('--baseline', default=None,
+                        help='compare with the results of a previous --output')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='allowed relative drop of events/s with respect to the baseline')
+    args = parser.parse_args()
+
+    config = dict((name, getattr(args, name)) for name in defaults)
+    inputFiles = generateFiles(args.dir, args.files, args.events, config)
+    results = runBenchmarks(inputFiles, args.backends, args.workers, args.chunk_size)
+
+    baseline = None
+    if args.baseline is not None:
+        with open(args.baseline) as baselineFile:
+            baseline = json.load(baselineFile)['results']
+    printResults(results, baseline)
+    if args.output is not None:
+        with open(args.output, 'w') as output:
+            json.dump({'config' : dict(config, nFiles=args.files, nEvents=args.events), 'results' : results}, output, indent=1, sort_keys=True)
+    if baseline is not None:
+        regressions = findRegressions(results, baseline, args.tolerance)
+        for name, ratio in regressions:
+            print 'Regression: %s at %.2f of the baseline events/s' % (name, ratio)
+        if regressions:
+            sys.exit(1)
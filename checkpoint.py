@@ -0,0 +1,185 @@
+import hashlib
+import itertools
+import multiprocessing
+import os
+import pickle
+import signal
+import time
+
+import columnar, instrument, scheduler
+from lazyroot import rt
+
+# Fault-tolerant long runs. Input files are processed one at a time (possibly
+# over several worker processes) and added to the analyses as they complete.
+# The filled histograms and the list of completed files are pickled to a
+# checkpoint every interval seconds, when the wall-time limit approaches, and
+# on SIGTERM/SIGUSR1 (as sent by batch systems before killing a job), so that
+# a restarted job resumes where the previous one stopped. Files that fail are
+# retried, then quarantined and listed instead of aborting the run.
+
+checkpointVersion = 3
+retryDelay = 5.
+
+class Checkpoint:
+
+    def __init__(self, path, analysisKeys, inputFiles):
+        self.path = path
+        self.analysisKeys = analysisKeys
+        self.inputsHash = hashlib.sha1('\n'.join(inputFiles)).hexdigest()
+        self.done = []
+        self.quarantine = {}
+
+    # add the checkpointed histograms to analyses; False if there is no checkpoint
+    def Load(self, analyses):
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, 'rb') as inputFile:
+            state = pickle.load(inputFile)
+        if state['version'] != checkpointVersion or state['analyses'] != self.analysisKeys:
+            raise ValueError('checkpoint %s was written for other analyses, cuts or histograms, remove it to start over' % self.path)
+        if state['inputs'] != self.inputsHash:
+            raise ValueError('checkpoint %s was written for other input files' % self.path)
+        for analysis, hists in zip(analyses, state['hists']):
+            scheduler.addHists(analysis.hists, hists)
+        self.done = state['done']
+        self.quarantine = state['quarantine']
+        return True
+
+    def Save(self, analyses):
+        state = {'version'    : checkpointVersion,
+                 'analyses'   : self.analysisKeys,
+                 'inputs'     : self.inputsHash,
+                 'hists'      : [analysis.hists for analysis in analyses],
+                 'done'       : self.done,
+                 'quarantine' : self.quarantine}
+        with open(self.path + '.tmp', 'wb') as outputFile:
+            pickle.dump(state, outputFile, pickle.HIGHEST_PROTOCOL)
+        os.rename(self.path + '.tmp', self.path)
+
+    def Report(self):
+        print '%d input files done, %d quarantined' % (len(self.done), len(self.quarantine))
+        for inputFile, error in sorted(self.quarantine.iteritems()):
+            print '    %s: %s' % (inputFile, error)
+
+# Set on SIGTERM/SIGUSR1, checked between files
+class StopRequest:
+
+    def __init__(self, signums = (signal.SIGTERM, signal.SIGUSR1)):
+        self.requested = False
+        self.previous = dict((signum, signal.signal(signum, self.Handle)) for signum in signums)
+
+    def Handle(self, signum, frame):
+        print 'Received signal %d, stopping after the current file' % signum
+        self.requested = True
+
+    def Restore(self):
+        for signum, handler in self.previous.iteritems():
+            signal.signal(signum, handler)
+
+# Fail early on files that cannot be read (missing, zombie, recovered or without the tree)
+def checkInput(inputFile, backend):
+    if backend != 'loop':
+        return
+    tfile = rt.TFile.Open(inputFile)
+    if not tfile or tfile.IsZombie():
+        raise IOError('cannot open %s' % inputFile)
+    try:
+        if tfile.TestBit(rt.TFile.kRecovered):
+            raise IOError('%s was not closed properly' % inputFile)
+        if not tfile.Get(columnar.treeName):
+            raise IOError('no %s in %s' % (columnar.treeName, inputFile))
+    finally:
+        tfile.Close()
+
+# (result of scheduler._runShard, None), or (None, error message) after retries failed attempts
+def _runFile(args):
+    analysisTypes, inputFile, backend, chunkSize, maxMemory, retries = args
+    for attempt in xrange(retries+1):
+        if attempt > 0:
+            time.sleep(retryDelay)
+        try:
+            checkInput(inputFile, backend)
+            return scheduler._runShard((analysisTypes, [inputFile], backend, chunkSize, maxMemory)), None
+        except Exception as error:
+            message = '%s: %s' % (error.__class__.__name__, error)
+    return None, message
+
+# results of a pool.imap, giving up waiting for them when a stop is requested
+def _iterateResults(results, stop):
+    while not stop.requested:
+        try:
+            yield results.next(timeout=1.)
+        except multiprocessing.TimeoutError:
+            pass
+        except StopIteration:
+            return
+
+# Fill the analyses of singlePass over inputFiles, resuming from the checkpoint
+# at path. Stops early (returning False) on a signal or when less than the time
+# of one more file is left before maxTime seconds
+def Run(singlePass, inputFiles, path, nWorkers = 1, backend = 'loop', chunkSize = 10000,
+        interval = 300., maxTime = None, retries = 1, retryQuarantined = False, maxMemory = None):
+    scheduler.checkBackend(backend)
+    analysisKeys = [scheduler.analysisKey(analysis) for analysis in singlePass.analyses]
+    analysisTypes = [analysis.__class__ for analysis in singlePass.analyses]
+    checkpoint = Checkpoint(path, analysisKeys, inputFiles)
+    if checkpoint.Load(singlePass.analyses):
+        print 'Resuming from %s: %d files done, %d quarantined' % (path, len(checkpoint.done), len(checkpoint.quarantine))
+    if retryQuarantined:
+        checkpoint.quarantine = {}
+    done = set(checkpoint.done)
+    todo = [inputFile for inputFile in inputFiles if inputFile not in done and inputFile not in checkpoint.quarantine]
+    print '%d / %d input files to process' % (len(todo), len(inputFiles))
+
+    parallel = nWorkers > 1 and len(todo) > 1
+    workerMemory = scheduler.workerBudget(maxMemory, nWorkers if parallel else 1)
+    jobs = [(analysisTypes, inputFile, backend, chunkSize, workerMemory, retries) for inputFile in todo]
+    pool = None
+    if parallel:
+        pool = multiprocessing.Pool(nWorkers)
+    # installed after the workers are forked, so that they still die on SIGTERM
+    stop = StopRequest()
+    if pool is not None:
+        results = _iterateResults(pool.imap(_runFile, jobs), stop)
+    else:
+        results = itertools.imap(_runFile, jobs)
+
+    # the in-process shards reset instrument.timer, so the totals are kept apart
+    timing = instrument.Timer()
+    start = lastSave = time.time()
+    processed = 0
+    try:
+        for inputFile, (result, error) in itertools.izip(todo, results):
+            if error is not None:
+                print 'Quarantining %s: %s' % (inputFile, error)
+                checkpoint.quarantine[inputFile] = error
+            else:
+                shardHists, branchBytes, treeBytes, shardTiming = result
+                for analysis, hists in zip(singlePass.analyses, shardHists):
+                    scheduler.addHists(analysis.hists, hists)
+                singlePass.AddBytes(branchBytes, treeBytes)
+                timing.Merge(shardTiming)
+                checkpoint.done.append(inputFile)
+            processed += 1
+            now = time.time()
+            if now - lastSave > interval:
+                checkpoint.Save(singlePass.analyses)
+                lastSave = now
+            if maxTime is not None and (now - start)*(processed+1)/processed > maxTime:
+                print 'Stopping before the wall-time limit'
+                break
+            if stop.requested:
+                break
+        checkpoint.Save(singlePass.analyses)
+    finally:
+        stop.Restore()
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+
+    instrument.timer.Reset()
+    instrument.timer.Merge(timing.Summary())
+    instrument.timer.begin = timing.begin
+    checkpoint.Report()
+    singlePass.Report()
+    return len(checkpoint.done) + len(checkpoint.quarantine) == len(inputFiles)
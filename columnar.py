@@ -0,0 +1,207 @@
+import numpy as np
+
+import dedup, kinematics
+
+# Columnar access to the trackingNtuple: branches are read in chunks of entries
+# and kept as flat NumPy content plus per-event offsets, so that the selections
+# of myMacro.py can be written as array operations instead of PyROOT loops.
+
+try:
+    import uproot
+except ImportError:
+    uproot = None
+
+treeName = 'trackingNtuple/tree'
+
+seedBranches = ['trk_seedIdx', 'trk_simTrkIdx',
+                'sim_px', 'sim_py', 'sim_pz', 'sim_pdgId',
+                'see_ecalDriven', 'see_algoOriginal']
+efficiencyBranches = ['sim_trkIdx', 'sim_px', 'sim_py', 'sim_pz', 'sim_pdgId',
+                      'sim_parentVtxIdx', 'simvtx_sourceSimIdx',
+                      'trk_seedIdx', 'see_ecalDriven', 'see_algoOriginal']
+
+class Jagged:
+
+    def __init__(self, offsets, content):
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.content = content
+
+    def __len__(self):
+        return len(self.offsets)-1
+
+    @property
+    def counts(self):
+        return np.diff(self.offsets)
+
+    @property
+    def starts(self):
+        return self.offsets[:-1]
+
+    # index of the parent entry of every element of the content
+    def parents(self):
+        return np.repeat(np.arange(len(self), dtype=np.int64), self.counts)
+
+    # global position in the content of the local index idx of entry parent
+    def globalIndex(self, parent, idx):
+        return self.offsets[parent] + idx
+
+def fromCounts(counts, content):
+    offsets = np.zeros(len(counts)+1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    return Jagged(offsets, content)
+
+# Convert whatever the reader returned (awkward0 JaggedArray, awkward>=1 array,
+# object array of sequences or plain numpy) into nested Jagged/numpy arrays
+def toJagged(array):
+    if isinstance(array, Jagged):
+        return array
+    if hasattr(array, 'counts') and hasattr(array, 'flatten'):
+        return fromCounts(np.asarray(array.counts), toJagged(array.flatten()))
+    if type(array).__module__.startswith('awkward'):
+        import awkward
+        if array.ndim == 1:
+            return np.asarray(array)
+        return fromCounts(np.asarray(awkward.num(array, axis=1)), toJagged(awkward.flatten(array, axis=1)))
+    array = np.asarray(array)
+    if array.dtype == object:
+        content = [y for x in array for y in x]
+        if len(content) and np.ndim(content[0]) > 0:
+            return fromCounts([len(x) for x in array], toJagged(_objectArray(content)))
+        return fromCounts([len(x) for x in array], np.array(content))
+    if array.ndim > 1:
+        return fromCounts(np.full(len(array), array.shape[1]), toJagged(array.reshape((-1,)+array.shape[2:])))
+    return array
+
+def _objectArray(seq):
+    array = np.empty(len(seq), dtype=object)
+    for i, x in enumerate(seq):
+        array[i] = x
+    return array
+
+# Iterate over the input files in chunks of at most chunkSize entries.
+# Every chunk is a dict branch name -> Jagged
+def iterateChunks(inputFiles, branches, chunkSize = 10000):
+    if uproot is None:
+        raise ImportError('the columnar backend needs uproot')
+    if int(uproot.__version__.split('.')[0]) < 4:
+        chunks = uproot.iterate(inputFiles, treeName, branches, entrysteps=chunkSize, namedecode='utf-8')
+    else:
+        chunks = uproot.iterate(['%s:%s' % (inputFile, treeName) for inputFile in inputFiles],
+                                branches, step_size=chunkSize, library='ak', how=dict)
+    for chunk in chunks:
+        yield dict((branch, toJagged(chunk[branch])) for branch in branches)
+
+# (first entry, last entry + 1) of the clusters of the given branches in one input file
+def clusterRanges(inputFile, branches):
+    if uproot is None:
+        raise ImportError('the columnar backend needs uproot')
+    tree = uproot.open(inputFile)[treeName]
+    if int(uproot.__version__.split('.')[0]) < 4:
+        return list(tree.clusters(branches))
+    offsets = tree.common_entry_offsets(filter_name=branches)
+    return zip(offsets[:-1], offsets[1:])
+
+# One chunk per entry range of one input file. ranges may be a generator:
+# every range is requested after the previous chunk was processed, and the
+# arrays read for it are not kept (nor cached by uproot) once it was. The
+# chunk is yielded without a local reference, so that the suspended generator
+# does not hold it while the next one is sized and read
+def iterateRanges(inputFile, branches, ranges):
+    if uproot is None:
+        raise ImportError('the columnar backend needs uproot')
+    tree = uproot.open(inputFile)[treeName]
+    for start, stop in ranges:
+        yield _readRange(tree, branches, start, stop)
+
+def _readRange(tree, branches, start, stop):
+    if int(uproot.__version__.split('.')[0]) < 4:
+        arrays = tree.arrays(branches, entrystart=start, entrystop=stop, namedecode='utf-8')
+    else:
+        arrays = tree.arrays(branches, entry_start=start, entry_stop=stop, library='ak', how=dict, array_cache=None)
+    return dict((branch, toJagged(arrays[branch])) for branch in branches)
+
+# Number of entries of one input file
+def numEntries(inputFile):
+    if uproot is None:
+        raise ImportError('the columnar backend needs uproot')
+    tree = uproot.open(inputFile)[treeName]
+    if int(uproot.__version__.split('.')[0]) < 4:
+        return tree.numentries
+    return tree.num_entries
+
+# Compressed size of the given branches, and of the whole tree, in one input file
+def branchBytes(inputFile, branches):
+    if uproot is None:
+        raise ImportError('the columnar backend needs uproot')
+    tree = uproot.open(inputFile)[treeName]
+    if int(uproot.__version__.split('.')[0]) < 4:
+        return dict((branch, tree[branch].compressedbytes()) for branch in branches), tree.compressedbytes()
+    return dict((branch, tree[branch].compressed_bytes) for branch in branches), tree.compressed_bytes
+
+# Per-electron columns shared by the seed and efficiency tables: sim kinematics,
+# pdgId, primary flag (only if the sim vertex branches were read), and the
+# matched seed (local index, -1 if none) with its ecalDriven flag and algo
+def electronColumns(chunk, simIdx, seedEvent, seedIdx):
+    px = chunk['sim_px'].content[simIdx]
+    py = chunk['sim_py'].content[simIdx]
+    pz = chunk['sim_pz'].content[simIdx]
+    columns = {'pt'    : kinematics.pt(px, py),
+               'eta'   : kinematics.eta(px, py, pz),
+               'pdgId' : np.asarray(chunk['sim_pdgId'].content[simIdx], dtype=np.int64)}
+    if 'simvtx_sourceSimIdx' in chunk:
+        columns['primary'] = isPrimary(chunk, simIdx)
+
+    matched = seedIdx >= 0
+    seeds = chunk['see_ecalDriven'].globalIndex(seedEvent[matched], seedIdx[matched])
+    columns['seedIdx'] = np.asarray(seedIdx, dtype=np.int64)
+    columns['ecalDriven'] = np.zeros(len(simIdx), dtype=bool)
+    columns['ecalDriven'][matched] = chunk['see_ecalDriven'].content[seeds] != 0
+    columns['algo'] = np.full(len(simIdx), -1, dtype=np.int64)
+    columns['algo'][matched] = chunk['see_algoOriginal'].content[seeds]
+    return columns
+
+# electrons whose parent vertex has no source sim particle, i.e. from the pp interaction
+def isPrimary(chunk, simIdx):
+    simvtxSourceSimIdx = chunk['simvtx_sourceSimIdx']
+    simEvent = chunk['sim_pdgId'].parents()[simIdx]
+    vtxIdx = simvtxSourceSimIdx.globalIndex(simEvent, chunk['sim_parentVtxIdx'].content[simIdx])
+    return simvtxSourceSimIdx.content.counts[vtxIdx] == 0
+
+# Vectorized version of the track loop of analyzeSeeds: sim-matched tracks whose
+# first sim particle is an electron, duplicates (same sim particle in the same
+# event) removed keeping the first track. Returns a dict of per-electron columns
+def selectSeedElectrons(chunk):
+    trkSeedIdx = chunk['trk_seedIdx']
+    trkSimTrkIdx = chunk['trk_simTrkIdx']
+    simPdgId = chunk['sim_pdgId']
+
+    trkEvent = trkSeedIdx.parents()
+    simsPerTrk = trkSimTrkIdx.content
+    matched = np.nonzero(simsPerTrk.counts > 0)[0]
+    simIdx = simPdgId.globalIndex(trkEvent[matched], simsPerTrk.content[simsPerTrk.starts[matched]])
+    isElectron = np.abs(simPdgId.content[simIdx]) == 11
+    matched = matched[isElectron]
+    simIdx = simIdx[isElectron]
+
+    unique = dedup.firstOccurrence(simIdx)
+    trkIdx = matched[unique]
+    simIdx = simIdx[unique]
+    return electronColumns(chunk, simIdx, trkEvent[trkIdx], trkSeedIdx.content[trkIdx])
+
+# Vectorized version of the sim loop of analyzeECALdrivenEfficiency: every sim
+# electron followed through sim -> first track -> seed, with the primary flag
+# from its parent vertex. The acceptance and primary selection is left to the
+# histogram filling
+def selectSimElectrons(chunk):
+    simPdgId = chunk['sim_pdgId']
+    simTrkIdx = chunk['sim_trkIdx']
+
+    simIdx = np.nonzero(np.abs(simPdgId.content) == 11)[0]
+    simEvent = simPdgId.parents()[simIdx]
+
+    trksPerSim = simTrkIdx.content
+    matched = np.nonzero(trksPerSim.counts[simIdx] > 0)[0]
+    trkIdx = chunk['trk_seedIdx'].globalIndex(simEvent[matched], trksPerSim.content[trksPerSim.starts[simIdx[matched]]])
+    seedIdx = np.full(len(simIdx), -1, dtype=np.int64)
+    seedIdx[matched] = chunk['trk_seedIdx'].content[trkIdx]
+    return electronColumns(chunk, simIdx, simEvent, seedIdx)
@@ -0,0 +1,68 @@
+import time
+
+import numpy as np
+
+# Duplicate removal. The GSF track collection can hold the same sim electron
+# more than once, and only the first track of each is kept. The per-entry loop
+# uses a Bitmap sized by the sim collection (constant-time membership), the
+# columnar backend a first-occurrence mask over the global sim indices.
+
+class Bitmap:
+
+    def __init__(self, size):
+        self.bits = bytearray(size)
+
+    def __contains__(self, idx):
+        return self.bits[idx] != 0
+
+    def Add(self, idx):
+        self.bits[idx] = 1
+
+# Positions of the first occurrence of every distinct key, in input order
+def firstOccurrence(keys):
+    unique, first = np.unique(keys, return_index=True)
+    return np.sort(first)
+
+def firstOccurrenceMask(keys):
+    mask = np.zeros(len(keys), dtype=bool)
+    mask[firstOccurrence(keys)] = True
+    return mask
+
+# Synthetic high-pileup events: nTracks tracks per event, matched to nSims sim
+# particles of which a fraction are duplicated
+def makeEvents(nEvents, nSims, nTracks, seed = 1):
+    rng = np.random.RandomState(seed)
+    return [rng.randint(0, nSims, nTracks) for ievent in xrange(nEvents)]
+
+def benchmark(nEvents = 20, nSims = 5000, nTracks = 2000):
+    events = makeEvents(nEvents, nSims, nTracks)
+    lists = [list(simIdxs) for simIdxs in events]
+
+    def withList():
+        for simIdxs in lists:
+            used = []
+            for simIdx in simIdxs:
+                if used.count(simIdx) > 0: continue
+                used.append(simIdx)
+
+    def withBitmap():
+        for simIdxs in lists:
+            used = Bitmap(nSims)
+            for simIdx in simIdxs:
+                if simIdx in used: continue
+                used.Add(simIdx)
+
+    def withMask():
+        offsets = np.arange(len(events))*nSims
+        firstOccurrenceMask(np.concatenate(events) + np.repeat(offsets, nTracks))
+
+    print 'Duplicate removal, %d events with %d tracks over %d sim particles' % (nEvents, nTracks, nSims)
+    for name, method in [('list.count', withList), ('Bitmap', withBitmap), ('firstOccurrenceMask', withMask)]:
+        start = time.time()
+        method()
+        elapsed = time.time() - start
+        print '    %-20s %8.3f s %12.0f tracks/s' % (name, elapsed, nEvents*nTracks/elapsed)
+
+if __name__ == '__main__':
+
+    benchmark()
@@ -0,0 +1,121 @@
+import math
+
+import numpy as np
+
+from lazyroot import rt
+
+# Efficiencies of the categories of an EffHistograms, computed from numerator
+# (per category) and denominator arrays in one vectorized pass instead of
+# dividing the TH1Ds in place: ratios, Clopper-Pearson or Wilson intervals for
+# every category and bin, and the integrated fractions shown in the legends.
+# The numerators are never modified, so the fractions can be recomputed at will.
+# Clopper-Pearson intervals need scipy (scipy.stats.beta) to be vectorized;
+# without it they fall back to TEfficiency::ClopperPearson, called once per
+# distinct (passed, total) pair. Wilson intervals need neither.
+
+try:
+    from scipy import special, stats
+except ImportError:
+    special = stats = None
+
+oneSigma = 0.682689492137086
+
+# z such that a standard normal falls in [-z, z] with probability level, by
+# bisection on math.erf (1 for oneSigma)
+def normalQuantile(level):
+    low, high = 0., 40.
+    for iteration in xrange(200):
+        middle = (low + high)/2
+        if math.erf(middle/math.sqrt(2.)) < level:
+            low = middle
+        else:
+            high = middle
+    return (low + high)/2
+
+class Efficiency:
+
+    # passed: (categories, bins) array, total: (bins,) array, under- and overflow included
+    def __init__(self, passed, total):
+        self.passed = np.atleast_2d(np.asarray(passed, dtype=np.float64))
+        self.total = np.asarray(total, dtype=np.float64)
+        self._intervals = {}
+
+    def Ratio(self):
+        total = np.where(self.total > 0, self.total, 1.)
+        return np.where(self.total > 0, self.passed/total, 0.)
+
+    # fraction of the total in the visible bins that falls in every category
+    def Fractions(self):
+        total = self.total[1:-1].sum()
+        return self.passed[:,1:-1].sum(axis=1)/total if total > 0 else np.zeros(len(self.passed))
+
+    # (low, high) arrays with the shape of passed, at confidence level
+    def Interval(self, method = 'clopper-pearson', level = oneSigma):
+        key = (method, level)
+        if key not in self._intervals:
+            if method == 'clopper-pearson':
+                self._intervals[key] = clopperPearson(self.passed, self.total, level)
+            elif method == 'wilson':
+                self._intervals[key] = wilson(self.passed, self.total, level)
+            else:
+                raise ValueError('unknown interval %s' % method)
+        return self._intervals[key]
+
+def clopperPearson(passed, total, level = oneSigma):
+    alpha = 1. - level
+    total = np.broadcast_to(total, passed.shape)
+    failed = np.maximum(total - passed, 0.)
+    if stats is not None:
+        with np.errstate(invalid='ignore'):
+            low = np.where(passed > 0, stats.beta.ppf(alpha/2, passed, failed + 1), 0.)
+            high = np.where(failed > 0, stats.beta.ppf(1 - alpha/2, passed + 1, failed), 1.)
+    else:
+        pairs, inverse = np.unique(np.stack([total.ravel(), passed.ravel()], axis=1), axis=0, return_inverse=True)
+        low = np.array([rt.TEfficiency.ClopperPearson(n, k, level, False) for n, k in pairs])[inverse].reshape(passed.shape)
+        high = np.array([rt.TEfficiency.ClopperPearson(n, k, level, True) for n, k in pairs])[inverse].reshape(passed.shape)
+    empty = total <= 0
+    return np.where(empty, 0., low), np.where(empty, 1., high)
+
+def wilson(passed, total, level = oneSigma):
+    z = special.ndtri(1 - (1. - level)/2) if special is not None else normalQuantile(level)
+    total = np.broadcast_to(total, passed.shape)
+    safeTotal = np.where(total > 0, total, 1.)
+    ratio = passed/safeTotal
+    denominator = 1. + z*z/safeTotal
+    center = (ratio + z*z/(2*safeTotal))/denominator
+    halfWidth = z/denominator*np.sqrt(np.maximum(ratio*(1. - ratio), 0.)/safeTotal + z*z/(4*safeTotal*safeTotal))
+    empty = total <= 0
+    return np.where(empty, 0., np.maximum(center - halfWidth, 0.)), np.where(empty, 1., np.minimum(center + halfWidth, 1.))
+
+# Contents of a TH1, under- and overflow included
+def th1Contents(hist):
+    return np.array([hist.GetBinContent(ibin) for ibin in xrange(hist.GetNbinsX()+2)])
+
+# One TH1D per category with the efficiency as content and the half width of
+# the interval as error
+def ratioHists(name, binning, categories, efficiency, method = 'clopper-pearson'):
+    from array import array
+    ratio = efficiency.Ratio()
+    low, high = efficiency.Interval(method)
+    hists = []
+    for icat, cat in enumerate(categories):
+        hist = rt.TH1D('eff'+cat+name, '', len(binning)-1, array('d', binning))
+        for ibin in xrange(len(binning)+1):
+            hist.SetBinContent(ibin, ratio[icat][ibin])
+            hist.SetBinError(ibin, (high[icat][ibin] - low[icat][ibin])/2)
+        hists.append(hist)
+    return hists
+
+# One TH1D per category covering its interval (content at the center, error
+# at the half width), to be drawn with option E2
+def bandHists(name, binning, efficiency, method = 'clopper-pearson'):
+    from array import array
+    low, high = efficiency.Interval(method)
+    hists = []
+    for icat in xrange(len(efficiency.passed)):
+        hist = rt.TH1D('band%d%s' % (icat, name), '', len(binning)-1, array('d', binning))
+        for ibin in xrange(len(binning)+1):
+            hist.SetBinContent(ibin, (high[icat][ibin] + low[icat][ibin])/2)
+            hist.SetBinError(ibin, (high[icat][ibin] - low[icat][ibin])/2)
+        hists.append(hist)
+    return hists
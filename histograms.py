@@ -0,0 +1,153 @@
+from array import array
+
+import numpy as np
+
+import efficiency, rebinning
+from lazyroot import rt
+
+# Array-backed drop-in for myMacro.EffHistograms. Contents and sums of squared
+# weights are kept in NumPy arrays that include the under- and overflow bins,
+# with the same bin convention as TAxis::FindBin, so a chunk of entries is
+# filled with one bincount per quantity. The TH1D versions (allHist/catHists)
+# are only built when requested; legends and stacks are drawn from the
+# efficiencies computed on the arrays (see efficiency.py). Rebin derives the
+# same histograms with any coarser binning made of edges of this one.
+
+class ArrayEffHistograms:
+
+    def __init__(self, name, binning, categories):
+        self.name = name
+        self.categories = categories
+        self.binning = np.asarray(binning, dtype=np.float64)
+        nbins = len(binning)+1
+        self.allCounts = np.zeros(nbins)
+        self.allEntries = 0
+        self.catCounts = np.zeros((len(categories), nbins))
+        self.catSumw2 = np.zeros((len(categories), nbins))
+        self.catEntries = np.zeros(len(categories), dtype=np.int64)
+        self.catWeighted = np.zeros(len(categories), dtype=bool)
+        self._hists = None
+        self._efficiency = None
+        self._ratioHists = None
+
+    def FindBin(self, vals):
+        return np.searchsorted(self.binning, vals, side='right')
+
+    def Fill(self, var, eta, cat, wgt = 1):
+        self.FillN([var], [cat], [wgt])
+
+    def FillN(self, vals, cats, wgts = None):
+        vals = np.asarray(vals, dtype=np.float64)
+        if len(vals) == 0: return
+        cats = np.asarray(cats, dtype=np.int64)
+        wgts = np.ones(len(vals)) if wgts is None else np.asarray(wgts, dtype=np.float64)
+        nbins = self.allCounts.shape[0]
+        ncats = len(self.categories)
+        bins = self.FindBin(vals)
+        self.allCounts += np.bincount(bins, minlength=nbins)
+        self.allEntries += len(vals)
+        flat = cats*nbins + bins
+        self.catCounts += np.bincount(flat, weights=wgts, minlength=ncats*nbins).reshape(ncats, nbins)
+        self.catSumw2 += np.bincount(flat, weights=wgts*wgts, minlength=ncats*nbins).reshape(ncats, nbins)
+        self.catEntries += np.bincount(cats, minlength=ncats)
+        self.catWeighted[np.unique(cats[wgts != 1])] = True
+        self._hists = None
+        self._efficiency = None
+
+    def Add(self, other):
+        self.allCounts += other.allCounts
+        self.allEntries += other.allEntries
+        self.catCounts += other.catCounts
+        self.catSumw2 += other.catSumw2
+        self.catEntries += other.catEntries
+        self.catWeighted |= other.catWeighted
+        self._hists = None
+        self._efficiency = None
+
+    # new histograms with binning, whose edges must be edges of self.binning,
+    # by summing adjacent bins (see rebinning.py)
+    def Rebin(self, binning):
+        binning = self.binning[rebinning.edgeIndices(self.binning, binning)]
+        hists = ArrayEffHistograms(self.name, binning, self.categories)
+        hists.allCounts = rebinning.rebin(self.allCounts, self.binning, binning)
+        hists.allEntries = self.allEntries
+        hists.catCounts = rebinning.rebin(self.catCounts, self.binning, binning)
+        hists.catSumw2 = rebinning.rebin(self.catSumw2, self.binning, binning)
+        hists.catEntries = self.catEntries.copy()
+        hists.catWeighted = self.catWeighted.copy()
+        return hists
+
+    def Contents(self):
+        return np.concatenate([[self.allCounts], self.catCounts, self.catSumw2])
+
+    def Efficiency(self):
+        if self._efficiency is None:
+            self._efficiency = efficiency.Efficiency(self.catCounts, self.allCounts)
+            self._ratioHists = None
+        return self._efficiency
+
+    # the category efficiencies as TH1Ds, shared by the legend and the stack
+    def RatioHists(self):
+        eff = self.Efficiency()
+        if self._ratioHists is None:
+            self._ratioHists = efficiency.ratioHists(self.name, self.binning, self.categories, eff)
+        return self._ratioHists
+
+    # TH1D copies of the arrays, built once and shared by the legend and the stack
+    def ToTH1(self):
+        if self._hists is None:
+            binning = array('d', self.binning)
+            allHist = rt.TH1D('all'+self.name, '', len(binning)-1, binning)
+            for ibin, content in enumerate(self.allCounts):
+                allHist.SetBinContent(ibin, content)
+            allHist.SetEntries(self.allEntries)
+            catHists = []
+            for icat, cat in enumerate(self.categories):
+                hist = rt.TH1D(cat+self.name, '', len(binning)-1, binning)
+                if self.catWeighted[icat]:
+                    hist.Sumw2()
+                for ibin, content in enumerate(self.catCounts[icat]):
+                    hist.SetBinContent(ibin, content)
+                    if self.catWeighted[icat]:
+                        hist.SetBinError(ibin, np.sqrt(self.catSumw2[icat][ibin]))
+                hist.SetEntries(self.catEntries[icat])
+                catHists.append(hist)
+            self._hists = allHist, catHists
+        return self._hists
+
+    @property
+    def allHist(self):
+        return self.ToTH1()[0]
+
+    @property
+    def catHists(self):
+        return self.ToTH1()[1]
+
+    def MakeLegend(self, x1, y1, x2, y2, colors):
+        legend = rt.TLegend(x1, y1, x2, y2)
+        if colors is not None:
+            legend.SetFillColor(colors[0])
+        fractions = self.Efficiency().Fractions()
+        for ih, hist in enumerate(self.RatioHists()):
+            legend.AddEntry(hist, '%s [%.1f%%]' % (self.categories[ih], 100*fractions[ih]), 'f')
+        return legend
+
+    def MakeStack(self, title, colors, etaCategory = None):
+        stack = rt.THStack('stack'+self.name, title)
+        for color, hist in zip(colors, self.RatioHists()):
+            hist.SetLineColor(rt.kBlack)
+            hist.SetFillColor(color)
+            stack.Add(hist, "hist")
+        return stack
+
+# ArrayEffHistograms with the contents of the TH1Ds of an EffHistograms
+def fromTH1s(name, binning, categories, allHist, catHists):
+    hists = ArrayEffHistograms(name, binning, categories)
+    nbins = len(hists.allCounts)
+    hists.allCounts = efficiency.th1Contents(allHist)
+    hists.allEntries = int(allHist.GetEntries())
+    hists.catCounts = np.array([efficiency.th1Contents(hist) for hist in catHists])
+    hists.catSumw2 = np.array([[hist.GetBinError(ibin)**2 for ibin in xrange(nbins)] for hist in catHists])
+    hists.catEntries = np.array([int(hist.GetEntries()) for hist in catHists], dtype=np.int64)
+    hists.catWeighted = np.array([hist.GetSumw2N() > 0 for hist in catHists])
+    return hists
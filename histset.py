@@ -0,0 +1,104 @@
+import numpy as np
+
+import histograms
+
+# N-dimensional histogram sets. A HistSet is described by a list of axes, each
+# reading one column of the per-electron tables: binned axes (edges, with under-
+# and overflow bins, TAxis::FindBin convention) or category axes (integer index
+# into labels, plus one slot for out-of-range indices). Filling is one bincount
+# over the flattened bin index; the one-dimensional EffHistograms needed for the
+# stacks are projections built on demand.
+
+class Axis:
+
+    def __init__(self, name, edges = None, labels = None, column = None):
+        if (edges is None) == (labels is None):
+            raise ValueError('axis %s needs either edges or labels' % name)
+        self.name = name
+        self.column = column or name
+        self.edges = None if edges is None else np.asarray(edges, dtype=np.float64)
+        self.labels = labels
+
+    @property
+    def size(self):
+        return len(self.edges)+1 if self.labels is None else len(self.labels)+1
+
+    def Index(self, vals):
+        if self.labels is None:
+            return np.searchsorted(self.edges, vals, side='right')
+        vals = np.asarray(vals, dtype=np.int64)
+        return np.where((vals >= 0) & (vals < len(self.labels)), vals, len(self.labels))
+
+class HistSet:
+
+    def __init__(self, name, axes, selection = None):
+        self.name = name
+        self.axes = axes
+        self.selection = selection
+        shape = tuple(axis.size for axis in axes)
+        self.entries = np.zeros(shape)
+        self.sumw = np.zeros(shape)
+        self.sumw2 = np.zeros(shape)
+
+    def Axis(self, name):
+        for axis in self.axes:
+            if axis.name == name:
+                return axis
+        raise KeyError('no axis %s in %s' % (name, self.name))
+
+    # columns: dict column name -> array, one entry per electron
+    def Fill(self, columns, wgts = None):
+        if self.selection is not None:
+            selected = np.asarray(columns[self.selection], dtype=bool)
+            columns = dict((column, np.asarray(vals)[selected]) for column, vals in columns.iteritems())
+            if wgts is not None:
+                wgts = np.asarray(wgts)[selected]
+        shape = self.entries.shape
+        flat = np.ravel_multi_index([axis.Index(columns[axis.column]) for axis in self.axes], shape)
+        if len(flat) == 0: return
+        wgts = np.ones(len(flat)) if wgts is None else np.asarray(wgts, dtype=np.float64)
+        size = self.entries.size
+        if len(flat) < size/64:
+            # a few entries (one event of the loop backend) in fine master bins
+            np.add.at(self.entries.reshape(-1), flat, 1)
+            np.add.at(self.sumw.reshape(-1), flat, wgts)
+            np.add.at(self.sumw2.reshape(-1), flat, wgts*wgts)
+            return
+        self.entries += np.bincount(flat, minlength=size).reshape(shape)
+        self.sumw += np.bincount(flat, weights=wgts, minlength=size).reshape(shape)
+        self.sumw2 += np.bincount(flat, weights=wgts*wgts, minlength=size).reshape(shape)
+
+    def Add(self, other):
+        self.entries += other.entries
+        self.sumw += other.sumw
+        self.sumw2 += other.sumw2
+
+    # EffHistograms of variable in the categories of category, summed over the
+    # other axes after restricting them with selection (axis name -> index or list)
+    def Project(self, name, variable, category, **selection):
+        index = []
+        for axis in self.axes:
+            if axis.name in selection:
+                index.append(np.atleast_1d(selection[axis.name]))
+            else:
+                index.append(np.arange(axis.size))
+        names = [axis.name for axis in self.axes]
+        keep = (names.index(variable), names.index(category))
+        others = tuple(i for i in xrange(len(self.axes)) if i not in keep)
+
+        def project(values):
+            values = values[np.ix_(*index)].sum(axis=others)
+            return values if keep[0] < keep[1] else values.T
+
+        variableAxis = self.Axis(variable)
+        categoryAxis = self.Axis(category)
+        hists = histograms.ArrayEffHistograms(name, variableAxis.edges, categoryAxis.labels)
+        entries, sumw, sumw2 = project(self.entries), project(self.sumw), project(self.sumw2)
+        ncats = len(categoryAxis.labels)
+        hists.allCounts = entries.sum(axis=1)
+        hists.allEntries = int(entries.sum())
+        hists.catCounts = sumw[:,:ncats].T.copy()
+        hists.catSumw2 = sumw2[:,:ncats].T.copy()
+        hists.catEntries = entries[:,:ncats].sum(axis=0).astype(np.int64)
+        hists.catWeighted = (sumw2[:,:ncats] != entries[:,:ncats]).any(axis=0)
+        return hists
@@ -0,0 +1,117 @@
+import hashlib
+import itertools
+import json
+import multiprocessing
+import os
+import pickle
+
+import instrument, scheduler
+
+# Per-file result store for incremental runs. Every input file is processed on
+# its own and its partial histograms are pickled to storeDir, together with the
+# path, size and mtime of the file and the keys of the analyses that filled
+# them (see scheduler.analysisKey) in index.json. The next run only processes
+# files that are new, whose size/mtime changed or that were filled by other
+# analyses, and merges the stored partials of all the other ones. The index is
+# saved after every file, so that an interrupted run keeps what it processed.
+
+storeVersion = 4
+
+class ResultStore:
+
+    def __init__(self, storeDir):
+        self.storeDir = storeDir
+        self.indexPath = os.path.join(storeDir, 'index.json')
+        self.index = {'version': storeVersion, 'files': {}}
+        if os.path.exists(self.indexPath):
+            with open(self.indexPath) as indexFile:
+                index = json.load(indexFile)
+            if index.get('version') == storeVersion:
+                self.index = index
+
+    def Save(self):
+        if not os.path.isdir(self.storeDir):
+            os.makedirs(self.storeDir)
+        with open(self.indexPath + '.tmp', 'w') as indexFile:
+            json.dump(self.index, indexFile, indent=1, sort_keys=True)
+        os.rename(self.indexPath + '.tmp', self.indexPath)
+
+    # the stored entry for inputFile, if it is still valid for these analyses
+    def Lookup(self, inputFile, analysisKeys):
+        entry = self.index['files'].get(inputFile)
+        stat = fileStat(inputFile)
+        if entry is None or stat is None:
+            return None
+        if [entry['size'], entry['mtime']] != list(stat) or entry['analyses'] != analysisKeys:
+            return None
+        if not os.path.exists(os.path.join(self.storeDir, entry['output'])):
+            return None
+        return entry
+
+    def Write(self, inputFile, analysisNames, analysisKeys, shardHists):
+        if not os.path.isdir(self.storeDir):
+            os.makedirs(self.storeDir)
+        output = 'partial_%s.pkl' % hashlib.sha1(inputFile).hexdigest()
+        with open(os.path.join(self.storeDir, output), 'wb') as outputFile:
+            pickle.dump(dict(zip(analysisNames, shardHists)), outputFile, pickle.HIGHEST_PROTOCOL)
+        stat = fileStat(inputFile)
+        self.index['files'][inputFile] = {'size'     : stat[0] if stat else None,
+                                          'mtime'    : stat[1] if stat else None,
+                                          'output'   : output,
+                                          'analyses' : analysisKeys}
+
+    def AddStored(self, entry, analyses):
+        with open(os.path.join(self.storeDir, entry['output']), 'rb') as inputFile:
+            stored = pickle.load(inputFile)
+        for analysis in analyses:
+            scheduler.addHists(analysis.hists, stored[analysis.__class__.__name__])
+
+    # Fill the analyses of singlePass over inputFiles, reprocessing only what changed
+    def Run(self, singlePass, inputFiles, nWorkers = 1, backend = 'loop', chunkSize = 10000, maxMemory = None):
+        scheduler.checkBackend(backend)
+        analysisNames = [analysis.__class__.__name__ for analysis in singlePass.analyses]
+        analysisKeys = [scheduler.analysisKey(analysis) for analysis in singlePass.analyses]
+        analysisTypes = [analysis.__class__ for analysis in singlePass.analyses]
+        stored = dict((inputFile, self.Lookup(inputFile, analysisKeys)) for inputFile in inputFiles)
+        changed = [inputFile for inputFile in inputFiles if stored[inputFile] is None]
+        print '%d / %d input files to process, %d from %s' % (len(changed), len(inputFiles), len(inputFiles)-len(changed), self.storeDir)
+
+        parallel = nWorkers > 1 and len(changed) > 1
+        workerMemory = scheduler.workerBudget(maxMemory, nWorkers if parallel else 1)
+        jobs = [(analysisTypes, [inputFile], backend, chunkSize, workerMemory) for inputFile in changed]
+        pool = multiprocessing.Pool(nWorkers) if parallel else None
+        # results arrive in the order of changed, a subsequence of inputFiles:
+        # every partial is stored, indexed and added in input file order as it
+        # arrives, then dropped, so that at most one is held at a time
+        results = pool.imap(scheduler._runShard, jobs) if pool is not None else itertools.imap(scheduler._runShard, jobs)
+        # the in-process shards reset instrument.timer, so the totals are kept apart
+        timing = instrument.Timer()
+        try:
+            for inputFile in inputFiles:
+                if stored[inputFile] is not None:
+                    self.AddStored(stored[inputFile], singlePass.analyses)
+                    continue
+                shardHists, branchBytes, treeBytes, shardTiming = next(results)
+                self.Write(inputFile, analysisNames, analysisKeys, shardHists)
+                self.Save()
+                for analysis, hists in zip(singlePass.analyses, shardHists):
+                    scheduler.addHists(analysis.hists, hists)
+                singlePass.AddBytes(branchBytes, treeBytes)
+                timing.Merge(shardTiming)
+                shardHists = None
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+        self.Save()
+        instrument.timer.Reset()
+        instrument.timer.Merge(timing.Summary())
+        instrument.timer.begin = timing.begin
+        singlePass.Report()
+
+def fileStat(inputFile):
+    try:
+        stat = os.stat(inputFile)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime
@@ -0,0 +1,89 @@
+import json
+import time
+from contextlib import contextmanager
+
+import memory
+
+# Lightweight instrumentation of the event loops: wall time per stage (input
+# reading, branch access, kinematics, histogram filling...), progress with
+# events/s and ETA, bytes read per input file, ROOT I/O statistics and peak
+# resident memory (of this process and of the workers merged in), all
+# summarised in a machine-readable JSON file so that runs can be compared.
+
+class Timer:
+
+    def __init__(self):
+        self.Reset()
+
+    def Reset(self):
+        self.begin = time.time()
+        self.stages = {}
+        self.files = []
+        self.io = {}
+        self.nevents = 0
+        self.workersPeakRSS = 0
+
+    def Add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.) + seconds
+
+    @contextmanager
+    def Stage(self, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.Add(name, time.time() - start)
+
+    def Progress(self, nevents, ntotal = None):
+        self.nevents = nevents
+        elapsed = time.time() - self.begin
+        rate = nevents/elapsed if elapsed > 0 else 0.
+        if ntotal is None:
+            print '%d entries processed (%.0f events/s)' % (nevents, rate)
+        elif rate == 0.:
+            print '%d / %d' % (nevents, ntotal)
+        else:
+            print '%d / %d (%.0f events/s, ETA %s)' % (nevents, ntotal, rate, formatTime((ntotal - nevents)/rate))
+
+    def AddFile(self, name, nbytes, nevents):
+        self.files.append({'file': name, 'bytes': nbytes, 'events': nevents})
+
+    # add the summary of another run, e.g. of a worker process
+    def Merge(self, summary):
+        self.nevents += summary['events']
+        for name, seconds in summary['stages'].iteritems():
+            self.Add(name, seconds)
+        self.files.extend(summary['files'])
+        for name, value in summary['io'].iteritems():
+            self.io[name] = self.io.get(name, 0) + value
+        self.workersPeakRSS = max(self.workersPeakRSS, summary['peakRSS'])
+
+    def Summary(self):
+        wall = time.time() - self.begin
+        return {'wall'            : wall,
+                'events'          : self.nevents,
+                'eventsPerSecond' : self.nevents/wall if wall > 0 else 0.,
+                'stages'          : dict(self.stages),
+                'bytesRead'       : sum(entry['bytes'] for entry in self.files),
+                'files'           : list(self.files),
+                'io'              : dict(self.io),
+                'peakRSS'         : max(self.workersPeakRSS, memory.peakRSS(children=True))}
+
+    def Write(self, path):
+        with open(path, 'w') as output:
+            json.dump(self.Summary(), output, indent=1, sort_keys=True)
+
+    def Print(self):
+        summary = self.Summary()
+        print 'Processed %d events in %s (%.0f events/s), %.1f MB read, peak RSS %.0f MB' % (summary['events'], formatTime(summary['wall']), summary['eventsPerSecond'], summary['bytesRead']/1e6, summary['peakRSS']/1e6)
+        for name, seconds in sorted(self.stages.items(), key=lambda item: -item[1]):
+            print '    %-20s %10.2f s  %5.1f%%' % (name, seconds, 100.*seconds/summary['wall'] if summary['wall'] > 0 else 0.)
+
+def formatTime(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return '%d:%02d:%02d' % (hours, minutes, seconds)
+
+# the timer the event loops and analyses report to
+timer = Timer()
+stage = timer.Stage
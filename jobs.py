@@ -0,0 +1,213 @@
+import json
+import multiprocessing
+import os
+import pickle
+import subprocess
+import sys
+import time
+
+import columnar, instrument, scheduler
+from lazyroot import rt
+
+# Batch submission. The input files are split into jobs of about the same
+# number of entries (contiguous in the file list), every job is described by a
+# JSON file in the jobs directory and runs as `myMacro.py --run-job <spec>`,
+# pickling the partial histograms of its analyses next to the spec. The
+# command lines are listed in commands.txt for the batch system; LocalExecutor
+# runs them as processes on this machine instead. mergeOutputs adds the
+# partial outputs in a tree of parallel merges, fanIn files at a time, like a
+# hierarchical hadd.
+
+# entries of the tree in one input file, read with ROOT (or uproot for the columnar backend)
+def countEntries(args):
+    inputFile, backend = args
+    if backend == 'columnar':
+        return columnar.numEntries(inputFile)
+    tfile = rt.TFile.Open(inputFile)
+    if not tfile or tfile.IsZombie():
+        raise IOError('cannot open %s' % inputFile)
+    try:
+        tree = tfile.Get(columnar.treeName)
+        if not tree:
+            raise IOError('no %s in %s' % (columnar.treeName, inputFile))
+        return tree.GetEntries()
+    finally:
+        tfile.Close()
+
+def countAllEntries(inputFiles, backend = 'loop', nWorkers = 1):
+    args = [(inputFile, backend) for inputFile in inputFiles]
+    if nWorkers > 1 and len(args) > 1:
+        pool = multiprocessing.Pool(nWorkers)
+        try:
+            return pool.map(countEntries, args)
+        finally:
+            pool.close()
+            pool.join()
+    return [countEntries(arg) for arg in args]
+
+# Split inputFiles into at most nJobs contiguous lists of about the same number
+# of entries: every file goes to the job its middle entry falls into
+def splitJobs(inputFiles, entries, nJobs):
+    total = float(sum(entries))
+    if total == 0:
+        return scheduler.shardFiles(inputFiles, nJobs)
+    nJobs = max(1, min(nJobs, len(inputFiles)))
+    jobs = [[] for ijob in xrange(nJobs)]
+    first = 0
+    for inputFile, nentries in zip(inputFiles, entries):
+        jobs[min(nJobs-1, int((first + nentries/2.)/total*nJobs))].append(inputFile)
+        first += nentries
+    return [job for job in jobs if job]
+
+def specPath(jobsDir, ijob):
+    return os.path.join(jobsDir, 'job_%d.json' % ijob)
+
+# spec paths of the jobs in jobsDir, in job order
+def listSpecs(jobsDir):
+    specs = []
+    while os.path.exists(specPath(jobsDir, len(specs))):
+        specs.append(specPath(jobsDir, len(specs)))
+    return specs
+
+# Write the job specs (options: backend, chunkSize... of the analyses) and
+# commands.txt; the outputs of jobs whose spec changed are removed. Returns
+# the spec paths
+def writeJobs(jobsDir, jobFiles, entries, script, options):
+    if not os.path.isdir(jobsDir):
+        os.makedirs(jobsDir)
+    previous = dict((path, loadSpec(path)) for path in listSpecs(jobsDir))
+    specs = []
+    jobEntries = []
+    for ijob, inputFiles in enumerate(jobFiles):
+        jobEntries.append(sum(entries[inputFile] for inputFile in inputFiles))
+        spec = dict(options, job=ijob, files=inputFiles, entries=jobEntries[-1], output='job_%d.pkl' % ijob)
+        path = specPath(jobsDir, ijob)
+        if previous.pop(path, None) != json.loads(json.dumps(spec)):
+            removeOutput(jobsDir, spec)
+        with open(path, 'w') as specFile:
+            json.dump(spec, specFile, indent=1, sort_keys=True)
+        specs.append(path)
+    with open(os.path.join(jobsDir, 'commands.txt'), 'w') as commands:
+        for path in specs:
+            commands.write('%s %s --run-job %s\n' % (sys.executable, os.path.abspath(script), os.path.abspath(path)))
+    for path, spec in previous.iteritems():
+        removeOutput(jobsDir, spec)
+        os.remove(path)
+    print 'Wrote %d jobs to %s, %d to %d entries each' % (len(specs), jobsDir, min(jobEntries), max(jobEntries))
+    return specs
+
+def removeOutput(jobsDir, spec):
+    path = os.path.join(jobsDir, spec['output'])
+    if os.path.exists(path):
+        os.remove(path)
+
+def loadSpec(path):
+    with open(path) as specFile:
+        return json.load(specFile)
+
+def outputPath(path):
+    return os.path.join(os.path.dirname(path), loadSpec(path)['output'])
+
+def saveOutput(path, output):
+    with open(path + '.tmp', 'wb') as outputFile:
+        pickle.dump(output, outputFile, pickle.HIGHEST_PROTOCOL)
+    os.rename(path + '.tmp', path)
+
+def loadOutput(path):
+    with open(path, 'rb') as inputFile:
+        return pickle.load(inputFile)
+
+# Body of one job: fill analyses over the files of the spec at path and pickle
+# their histograms, with the timing summary, to the output of the spec
+def runJob(path, analyses):
+    spec = loadSpec(path)
+    scheduler.checkBackend(spec['backend'])
+    singlePass = scheduler.Pass(analyses)
+    if spec['backend'] == 'loop':
+        chain = rt.TChain(columnar.treeName)
+        for inputFile in spec['files']:
+            chain.Add(inputFile)
+        singlePass.Run(chain, spec.get('cacheSize', 0), spec.get('maxMemory'))
+    else:
+        singlePass.RunColumnar(spec['files'], spec.get('chunkSize', 10000), spec.get('maxMemory'))
+    instrument.timer.Print()
+    saveOutput(outputPath(path), {'analyses' : [scheduler.analysisKey(analysis) for analysis in analyses],
+                                  'hists'    : [analysis.hists for analysis in analyses],
+                                  'timings'  : [instrument.timer.Summary()]})
+
+# Stand-in for the batch system: runs the commands of the jobs whose output is
+# missing, nWorkers at a time, each logging to job_<i>.log; returns the specs
+# of the jobs that failed
+class LocalExecutor:
+
+    def __init__(self, nWorkers = 1, poll = 0.5):
+        self.nWorkers = max(1, nWorkers)
+        self.poll = poll
+
+    def Run(self, specs, script):
+        todo = [path for path in specs if not os.path.exists(outputPath(path))]
+        print 'Running %d / %d jobs (%d already done) in %d processes' % (len(todo), len(specs), len(specs)-len(todo), self.nWorkers)
+        running = {}
+        failed = []
+        ndone = 0
+        while todo or running:
+            while todo and len(running) < self.nWorkers:
+                path = todo.pop(0)
+                log = open(os.path.splitext(path)[0] + '.log', 'w')
+                process = subprocess.Popen([sys.executable, os.path.abspath(script), '--run-job', path], stdout=log, stderr=subprocess.STDOUT)
+                running[process] = path, log
+            time.sleep(self.poll)
+            for process in [process for process in running if process.poll() is not None]:
+                path, log = running.pop(process)
+                log.close()
+                ndone += 1
+                if process.returncode != 0:
+                    print 'Job %s failed with status %d, see %s' % (path, process.returncode, log.name)
+                    failed.append(path)
+                else:
+                    print 'Job %d / %d done: %s' % (ndone, ndone + len(running) + len(todo), path)
+        return failed
+
+# add the outputs at paths into one output at mergedPath
+def _mergeGroup(args):
+    paths, mergedPath = args
+    merged = loadOutput(paths[0])
+    for path in paths[1:]:
+        output = loadOutput(path)
+        if output['analyses'] != merged['analyses']:
+            raise ValueError('%s was written by other analyses than %s' % (path, paths[0]))
+        scheduler.addHists(merged['hists'], output['hists'])
+        merged['timings'].extend(output['timings'])
+    saveOutput(mergedPath, merged)
+    return mergedPath
+
+# Merge the job outputs of specs in levels of parallel merges of fanIn files;
+# returns the merged output, written to jobsDir/merged.pkl
+def mergeOutputs(specs, jobsDir, fanIn = 4, nWorkers = 1):
+    if not specs:
+        raise IOError('no jobs in %s' % jobsDir)
+    paths = [outputPath(path) for path in specs]
+    missing = [path for path in paths if not os.path.exists(path)]
+    if missing:
+        raise IOError('%d job outputs are missing, e.g. %s' % (len(missing), missing[0]))
+    fanIn = max(2, fanIn)
+    pool = multiprocessing.Pool(nWorkers) if nWorkers > 1 else None
+    level = 0
+    try:
+        while len(paths) > 1 or level == 0:
+            groups = [(paths[i:i+fanIn], os.path.join(jobsDir, 'merge_%d_%d.pkl' % (level, i//fanIn)))
+                      for i in xrange(0, len(paths), fanIn)]
+            print 'Merge level %d: %d files into %d' % (level, len(paths), len(groups))
+            merged = pool.map(_mergeGroup, groups) if pool is not None and len(groups) > 1 else map(_mergeGroup, groups)
+            if level > 0:
+                for path in paths:
+                    os.remove(path)
+            paths = merged
+            level += 1
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+    finalPath = os.path.join(jobsDir, 'merged.pkl')
+    os.rename(paths[0], finalPath)
+    return loadOutput(finalPath)
@@ -0,0 +1,39 @@
+import numpy as np
+
+# Sim-particle kinematics computed directly from px, py, pz, with the same
+# conventions as ROOT::Math::PxPyPzMVector::Pt()/Eta() so that histograms are
+# bin-by-bin identical to the ones filled from Math.PxPyPzMVector. Every
+# function takes scalars or arrays and returns the same kind.
+
+bigZScaled = np.finfo(np.float64).eps**-0.25
+etaMax = 22756.0
+
+def pt(px, py):
+    px = np.asarray(px, dtype=np.float64)
+    py = np.asarray(py, dtype=np.float64)
+    return np.sqrt(px*px + py*py)[()]
+
+def eta(px, py, pz):
+    ndim = np.ndim(pz)
+    rho = np.atleast_1d(pt(px, py))
+    z = np.atleast_1d(np.asarray(pz, dtype=np.float64))
+    result = np.where(z > 0, z + etaMax, z - etaMax)
+    result[z == 0] = 0.
+    positive = rho > 0
+    zScaled = z[positive]/rho[positive]
+    values = np.empty(len(zScaled))
+    central = np.abs(zScaled) < bigZScaled
+    values[central] = np.log(zScaled[central] + np.sqrt(zScaled[central]*zScaled[central] + 1.0))
+    forward = np.nonzero(~central & (zScaled > 0))[0]
+    values[forward] = np.log(2.0*zScaled[forward] + 0.5/zScaled[forward])
+    backward = np.nonzero(~central & (zScaled < 0))[0]
+    values[backward] = -np.log(-2.0*zScaled[backward])
+    result[positive] = values
+    return result[0] if ndim == 0 else result
+
+# Index of the category [cats[i], cats[i+1]) of every value, values above the
+# last edge going to the last category
+def category(vals, cats):
+    ndim = np.ndim(vals)
+    result = np.minimum(np.digitize(np.atleast_1d(vals), cats)-1, len(cats)-2)
+    return int(result[0]) if ndim == 0 else result
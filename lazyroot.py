@@ -0,0 +1,21 @@
+# ROOT, imported (in batch mode) on the first attribute access of rt, so that
+# the modules that only need it to draw or to loop over a TChain can be
+# imported, and used in pool workers, without paying for the cling startup.
+
+class LazyROOT(object):
+
+    def __getattr__(self, name):
+        value = getattr(load(), name)
+        setattr(self, name, value)
+        return value
+
+_modules = []
+
+def load():
+    if not _modules:
+        import ROOT
+        ROOT.gROOT.SetBatch(True)
+        _modules.append(ROOT)
+    return _modules[0]
+
+rt = LazyROOT()
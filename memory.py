@@ -0,0 +1,94 @@
+import re
+import sys
+import resource
+
+import numpy as np
+
+# Memory budget of the columnar event loop. Instead of a fixed number of
+# entries per chunk, a ChunkSizer reads a small first chunk, measures the bytes
+# per entry of the arrays read and the peak memory the analyses reach while
+# processing them (relative to the size of the arrays), and sizes the next
+# chunks so that the process stays within the budget. Chunks never span two
+# input files, and are released before the next one is read.
+
+units = {'': 1, 'K': 1024, 'M': 1024**2, 'G': 1024**3, 'T': 1024**4}
+
+# '2GB', '512M', '1.5 GiB', '1000000' -> bytes
+def parseSize(text):
+    match = re.match(r'^\s*([0-9]*\.?[0-9]+)\s*([KMGT]?)(i?B)?\s*$', text, re.IGNORECASE)
+    if match is None:
+        raise ValueError('invalid memory size %s' % text)
+    return int(float(match.group(1))*units[match.group(2).upper()])
+
+# resident set size of this process, in bytes
+def currentRSS():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1])*resource.getpagesize()
+    except IOError:
+        return peakRSS()
+
+# largest resident set size of this process (or of any of its finished
+# children, if larger), in bytes
+def peakRSS(children = False):
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if children:
+        peak = max(peak, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak if sys.platform == 'darwin' else peak*1024
+
+# size of the arrays of a chunk (dict branch -> Jagged or numpy array)
+def arrayBytes(array):
+    if isinstance(array, dict):
+        return sum(arrayBytes(value) for value in array.itervalues())
+    if isinstance(array, np.ndarray):
+        return array.nbytes
+    return array.offsets.nbytes + arrayBytes(array.content)
+
+class ChunkSizer:
+
+    def __init__(self, maxMemory, firstSize = 100, minSize = 10, margin = 0.9, overhead = 4.):
+        self.maxMemory = maxMemory
+        self.firstSize = firstSize
+        self.minSize = minSize
+        self.margin = margin
+        self.bytesPerEntry = None
+        self.overhead = overhead   # peak memory growth while processing a chunk over the size of its arrays
+        self.rssBefore = self.peakBefore = 0
+
+    # entries of the next chunk
+    def Size(self):
+        if self.bytesPerEntry is None:
+            return self.firstSize
+        free = self.margin*self.maxMemory - currentRSS()
+        return max(self.minSize, int(free/(self.overhead*self.bytesPerEntry)))
+
+    # (start, stop) entry ranges covering nentries, each sized when requested
+    def Ranges(self, nentries):
+        start = 0
+        while start < nentries:
+            stop = min(nentries, start + self.Size())
+            yield start, stop
+            start = stop
+
+    # around the read and processing of every chunk
+    def Begin(self):
+        self.rssBefore = currentRSS()
+        self.peakBefore = peakRSS()
+
+    def End(self, chunk, nentries):
+        nbytes = arrayBytes(chunk)
+        if nentries == 0 or nbytes == 0: return
+        # heavier chunks raise the bytes per entry at once, lighter ones lower it slowly
+        perEntry = nbytes/float(nentries)
+        if self.bytesPerEntry is None:
+            self.bytesPerEntry = perEntry
+        else:
+            self.bytesPerEntry = max(perEntry, 0.9*self.bytesPerEntry + 0.1*perEntry)
+        # the growth of the peak is an upper bound of the memory the chunk
+        # needed, and equal to it when the chunk set a new peak
+        peak = peakRSS()
+        growth = (peak - self.rssBefore)/float(nbytes)
+        if peak > self.peakBefore:
+            self.overhead = max(1., growth)
+        else:
+            self.overhead = max(1., min(self.overhead, growth))
@@ -1,10 +1,13 @@
-from ROOT import *
-gROOT.SetBatch(True)
 from array import *
 import numpy as np
 
 import sys
-import CMS_lumi, tdrstyle
+import math
+import argparse
+import pickle
+import lazyroot
+from lazyroot import rt
+import columnar, scheduler, skim, incremental, dedup, kinematics, histograms, histset, rendering, instrument, prefetch, checkpoint, rdf, efficiency, rebinning, memory, jobs
 
 iPos    = 0
 iPeriod = 0
@@ -12,14 +15,20 @@ H_ref = 600;
 W_ref = 800; 
 
 etaCategories = [0.0,1.0,1.444,1.556,2.0,2.5]
-colorSeven = [TColor.GetColor(244,109,67),
-              TColor.GetColor(253,174,97),
-              TColor.GetColor(254,224,144),
-              TColor.GetColor(224,243,248),
-              TColor.GetColor(171,217,233),
-              TColor.GetColor(116,173,209),
-              TColor.GetColor(69,117,180)]
-colorTwo = [TColor.GetColor(255,255,204), TColor.GetColor(12,44,132)]
+# Selection of the analyses; the scan mode fills the histograms of several
+# variations of it in the same pass (see ScanAnalysis)
+defaultCuts = {'ptThreshold'   : 10.,            # minimum pt of the electrons of the eta figures
+               'maxEta'        : 2.5,            # |eta| acceptance of the efficiency study
+               'etaCategories' : etaCategories}  # |eta| edges of the categories of the seed study
+# RGB, turned into ROOT colour indices by rootColors when drawing
+colorSeven = [(244,109,67),
+              (253,174,97),
+              (254,224,144),
+              (224,243,248),
+              (171,217,233),
+              (116,173,209),
+              (69,117,180)]
+colorTwo = [(255,255,204), (12,44,132)]
 seedNames = ['initialStepSeeds',
              'highPtTripletStepSeeds',
              'mixedTripletStepSeeds',
@@ -28,47 +37,117 @@ seedNames = ['initialStepSeeds',
              'pixelPairElectronSeeds',
              'stripPairElectronSeeds']
 seedTypes = ['ECALdriven', 'TRKdriven']
+# trackingNtuple_1.root to trackingNtuple_<defaultNFiles>.root
+defaultInputDir = '/eos/uscms/store/user/rclsa/GsfTrackingNtuple/ValTrkGSF_1_0/DYJetsToLL_M-50_TuneCUETP8M1_13TeV-madgraphMLM-pythia8'
+defaultNFiles = 785
 
 class EffHistograms:
     
     def __init__(self, name, binning, categories):
         self.name = name
         self.categories = categories
-        self.allHist = TH1D('all'+name, '', len(binning)-1, array('d', binning))
+        self.binning = binning
+        self.allHist = rt.TH1D('all'+name, '', len(binning)-1, array('d', binning))
 
         self.catHists = []
         for cat in categories:
-            self.catHists.append(TH1D(cat+name,'', len(binning)-1, array('d', binning)))
+            self.catHists.append(rt.TH1D(cat+name,'', len(binning)-1, array('d', binning)))
+        self._efficiency = None
+        self._ratioHists = None
 
     def Fill(self, var, eta, cat, wgt = 1):
         self.allHist.Fill(var)
         self.catHists[cat].Fill(var, wgt)
+        self._efficiency = None
+
+    # Fill a whole array of entries at once, in the same order as repeated Fill calls
+    def FillN(self, vals, cats, wgts = None):
+        vals = np.ascontiguousarray(vals, dtype=np.float64)
+        if len(vals) == 0: return
+        cats = np.asarray(cats)
+        wgts = np.ones(len(vals)) if wgts is None else np.ascontiguousarray(wgts, dtype=np.float64)
+        self.allHist.FillN(len(vals), vals, np.ones(len(vals)))
+        for icat, hist in enumerate(self.catHists):
+            inCat = cats == icat
+            if not inCat.any(): continue
+            hist.FillN(int(inCat.sum()), np.ascontiguousarray(vals[inCat]), np.ascontiguousarray(wgts[inCat]))
+        self._efficiency = None
+
+    # Merge the content of another EffHistograms with the same binning and categories
+    def Add(self, other):
+        self.allHist.Add(other.allHist)
+        for hist, otherHist in zip(self.catHists, other.catHists):
+            hist.Add(otherHist)
+        self._efficiency = None
+
+    # bin contents and errors of all the histograms, under- and overflow included
+    def Contents(self):
+        return np.array([[(hist.GetBinContent(ibin), hist.GetBinError(ibin)) for ibin in xrange(hist.GetNbinsX()+2)]
+                         for hist in [self.allHist] + self.catHists])
+
+    # numerators and denominator as arrays, read once from the TH1Ds
+    def Efficiency(self):
+        if self._efficiency is None:
+            self._efficiency = efficiency.Efficiency([efficiency.th1Contents(hist) for hist in self.catHists],
+                                                     efficiency.th1Contents(self.allHist))
+            self._ratioHists = None
+        return self._efficiency
+
+    # the category histograms divided by allHist, shared by the legend and the stack
+    def RatioHists(self):
+        eff = self.Efficiency()
+        if self._ratioHists is None:
+            self._ratioHists = efficiency.ratioHists(self.name, self.binning, self.categories, eff)
+        return self._ratioHists
+
+    # array-backed histograms with a coarser binning made of edges of self.binning
+    def Rebin(self, binning):
+        return histograms.fromTH1s(self.name, self.binning, self.categories, self.allHist, self.catHists).Rebin(binning)
 
     def MakeLegend(self, x1, y1, x2, y2, colors):
-        legend = TLegend(x1, y1, x2, y2)
+        legend = rt.TLegend(x1, y1, x2, y2)
         if colors is not None:
             legend.SetFillColor(colors[0])
-        for ih, hist in enumerate(self.catHists):
-            legend.AddEntry(hist, '%s [%.1f%%]' % (self.categories[ih], 100*hist.Integral()/self.allHist.Integral()), 'f')
+        fractions = self.Efficiency().Fractions()
+        for ih, hist in enumerate(self.RatioHists()):
+            legend.AddEntry(hist, '%s [%.1f%%]' % (self.categories[ih], 100*fractions[ih]), 'f')
         return legend
     
     def MakeStack(self, title, colors, etaCategory = None):
-        stack = THStack('stack'+self.name, title)
-        for color, hist in zip(colors, self.catHists):
-            hist.SetLineColor(kBlack)
+        stack = rt.THStack('stack'+self.name, title)
+        for color, hist in zip(colors, self.RatioHists()):
+            hist.SetLineColor(rt.kBlack)
             hist.SetFillColor(color)
-            hist.Divide(self.allHist)
             stack.Add(hist, "hist")
         return stack
 
+# Histogram class used by the analyses: EffHistograms, or the array-backed
+# histograms.ArrayEffHistograms with the same interface
+histogramsType = EffHistograms
+
+# works on a single value or on a whole array of them
 def getBin(val, cats):
-    cat = int(np.digitize([val],cats)[0])-1
-    if cat > len(cats)-2: cat = len(cats)-2
-    return cat
+    return kinematics.category(val, cats)
+
+_colorIndices = {}
+
+def rootColors(rgbs):
+    if rgbs is None:
+        return None
+    for rgb in rgbs:
+        if rgb not in _colorIndices:
+            _colorIndices[rgb] = rt.TColor.GetColor(*rgb)
+    return [_colorIndices[rgb] for rgb in rgbs]
 
-# common configuration for texts
+_graphics = []
+
+# common configuration for texts, done once, before the first figure
 def setupGraphics():
 
+    if _graphics: return
+    _graphics.append(True)
+    lazyroot.load() # in batch mode, before the style modules import ROOT
+    import CMS_lumi, tdrstyle
     tdrstyle.setTDRStyle()
     CMS_lumi.lumi_7TeV = "4.8 fb^{-1}"
     CMS_lumi.lumi_8TeV = "18.3 fb^{-1}"
@@ -115,7 +194,9 @@ def setupLegend(l):
 
 def printHist(hist,legend = None):
 
-    canvas = TCanvas('canvas_%s'%hist.GetName(),'Canvas %s'%hist.GetTitle(),50,50,W_ref,H_ref)
+    setupGraphics()
+    import CMS_lumi
+    canvas = rt.TCanvas('canvas_%s'%hist.GetName(),'Canvas %s'%hist.GetTitle(),50,50,W_ref,H_ref)
     canvas.cd()
     setupCanvas(canvas)
     setupHists(hist)
@@ -129,203 +210,653 @@ def printHist(hist,legend = None):
         legend.Draw()
     return canvas
 
-def analyzeSeeds(chain):
+# One output figure: the stack and legend of an EffHistograms, drawn by printHist
+# and printed to every extension. hists are the master histograms; if binning is
+# given, the figure is drawn from them rebinned to it
+class Plot:
 
-    # Define the binning to be logarithmic uniform
-    ptBinning = [0.5]
-    etaBinning = [-2.5]
-    for i in xrange(1,51):
-        ptBinning.append(TMath.Power(10,TMath.Log10(5)-1+i*(TMath.Log10(2)+2.-TMath.Log10(5)+1.)/50))
-        etaBinning.append(-2.5+(i*5.)/50.)
-        
-    # Add histograms
-    ptECALdrivenSeedHist = EffHistograms('ptECALdrivenSeedHist', ptBinning, seedNames)
-    etaECALdrivenSeedHist = EffHistograms('etaECALdrivenSeedHist', etaBinning, seedNames)
-    ptALLSeedHist = EffHistograms('ptALLSeedHist', ptBinning, seedTypes)
-    etaALLSeedHist = EffHistograms('etaALLSeedHist', etaBinning, seedTypes)
-
-    # In eta categories
-    ptALLSeedHistEtaCategories = [EffHistograms('ptALLSeedHistEta1', ptBinning, seedTypes),
-                                  EffHistograms('ptALLSeedHistEta2', ptBinning, seedTypes),
-                                  EffHistograms('ptALLSeedHistEta3', ptBinning, seedTypes),
-                                  EffHistograms('ptALLSeedHistEta4', ptBinning, seedTypes),
-                                  EffHistograms('ptALLSeedHistEta5', ptBinning, seedTypes)]
-
-    nentries = chain.GetEntries()
-    for ientry, events in enumerate(chain):
-        if ientry % 1000 == 0:
-            print '%d / %d' % (ientry, nentries)
-        usedSimIdx = [] # Apparently we have an irritating duplication of tracks in electronGsfTracks.
-                        # I should fix that in the next version 
+    def __init__(self, name, hists, title, colors, legendBox, legendColors, logx = False, maximum = 1, extensions = ('png', 'pdf'), bands = False, binning = None):
+        self.name = name
+        self.hists = hists
+        self.binning = binning
+        self.title = title
+        self.colors = colors
+        self.legendBox = legendBox
+        self.legendColors = legendColors
+        self.logx = logx
+        self.maximum = maximum
+        self.extensions = extensions
+        self.bands = bands
+        self._hists = None
+
+    def Style(self):
+        binning = None if self.binning is None else tuple(self.binning)
+        return (self.title, self.colors, self.legendBox, self.legendColors, self.logx, self.maximum, self.extensions, self.bands, binning)
+
+    # the histograms with the binning of the figure
+    def Hists(self):
+        if self._hists is None:
+            self._hists = self.hists if self.binning is None else self.hists.Rebin(self.binning)
+        return self._hists
+
+    def Outputs(self):
+        return ['%s.%s' % (self.name, extension) for extension in self.extensions]
+
+def makeStackAndLegend(plot):
+    x1, y1, x2, y2 = plot.legendBox
+    legend = plot.Hists().MakeLegend(x1, y1, x2, y2, rootColors(plot.legendColors))
+    stack = plot.Hists().MakeStack(plot.title, rootColors(plot.colors))
+    if plot.maximum is not None:
+        stack.SetMaximum(plot.maximum)
+    return stack, legend
+
+# Clopper-Pearson bands on the boundaries between the stacked fractions, for
+# previews filled from a sample
+def makeBands(hists):
+    eff = hists.Efficiency()
+    bands = efficiency.bandHists(hists.name, hists.binning, efficiency.Efficiency(np.cumsum(eff.passed, axis=0), eff.total))
+    for band in bands:
+        band.SetFillColor(rt.kBlack)
+        band.SetFillStyle(3004)
+        band.SetMarkerSize(0)
+    return bands
+
+def makeStacksAndLegends(plots):
+    result = ()
+    for plot in plots:
+        result += makeStackAndLegend(plot)
+    return result
+
+def renderPlot(plot):
+    stack, legend = makeStackAndLegend(plot)
+    canvas = printHist(stack, legend)
+    if plot.bands:
+        bands = makeBands(plot.Hists())
+        for band in bands:
+            band.Draw('E2 same')
+        canvas.Update()
+    if plot.logx:
+        canvas.SetLogx(1)
+        canvas.Update()
+    for output in plot.Outputs():
+        canvas.Print(output)
+
+_binnings = {}
+
+# Figure binnings: ptBins bins from 0.5 to 200 GeV, logarithmic uniform (or
+# linear), and etaBins bins from -2.5 to 2.5; computed once per choice
+def makeBinnings(ptBins = 50, etaBins = 50, ptScale = 'log'):
+
+    key = (ptBins, etaBins, ptScale)
+    if key not in _binnings:
+        ptBinning = [0.5]
+        etaBinning = [-2.5]
+        for i in xrange(1,ptBins+1):
+            if ptScale == 'log':
+                ptBinning.append(math.pow(10,math.log10(5)-1+i*(math.log10(2)+2.-math.log10(5)+1.)/ptBins))
+            else:
+                ptBinning.append(0.5+(i*199.5)/ptBins)
+        for i in xrange(1,etaBins+1):
+            etaBinning.append(-2.5+(i*5.)/etaBins)
+        _binnings[key] = ptBinning, etaBinning
+    ptBinning, etaBinning = _binnings[key]
+    return list(ptBinning), list(etaBinning)
+
+# Binnings the histograms are filled with: every bin of the standard binnings
+# split in masterSplit, plus a linear pt grid of 50*masterSplit bins, so that
+# any log (linear) binning whose number of bins divides 50*masterSplit is
+# derived exactly by merging bins
+masterSplit = 8
+
+def masterBinnings():
+
+    ptBinning, etaBinning = makeBinnings()
+    linearPtBinning = makeBinnings(50*masterSplit, 50, 'linear')[0]
+    ptMaster = rebinning.union(rebinning.subdivide(ptBinning, masterSplit, log=True), linearPtBinning)
+    return ptMaster.tolist(), rebinning.subdivide(etaBinning, masterSplit).tolist()
+
+# Histogram sets of the seed composition study: (name, axes, selection column).
+# Every axis reads one column of seedColumns; a new slicing is one more axis
+def seedHistConfig(cuts = defaultCuts):
+
+    ptBinning, etaBinning = masterBinnings()
+    edges = cuts['etaCategories']
+    etaLabels = ['%.3g<|#eta|<%.3g' % (low, high) for low, high in zip(edges[:-1], edges[1:])]
+    return [('ptSeedHists', [histset.Axis('pt', ptBinning),
+                             histset.Axis('etaCategory', labels=etaLabels),
+                             histset.Axis('seedType', labels=seedTypes),
+                             histset.Axis('algo', labels=seedNames)], None),
+            ('etaSeedHists', [histset.Axis('eta', etaBinning),
+                              histset.Axis('seedType', labels=seedTypes),
+                              histset.Axis('algo', labels=seedNames)], 'highPt')]
+
+def bookSeedHists(cuts = defaultCuts):
+
+    return [histset.HistSet(name, axes, selection) for name, axes, selection in seedHistConfig(cuts)]
+
+# The seed composition study, as an analysis of a scheduler.Pass
+class SeedAnalysis:
+
+    branches = columnar.seedBranches
+
+    def __init__(self):
+        self.hists = bookSeedHists()
+
+    def Fill(self, events, tables):
+        electrons = tables.Get('seeds', seedElectronTable)
+        if electrons is not None:
+            self.FillTable(electrons)
+
+    def FillChunk(self, chunk, tables):
+        with instrument.stage('select'):
+            electrons = tables.Get('seeds', columnar.selectSeedElectrons)
+        self.FillTable(electrons)
+
+    def FillTable(self, electrons):
+        with instrument.stage('fill'):
+            fillSeedHists(electrons, *self.hists)
+
+    def Key(self):
+        return defaultCuts
+
+    def Finish(self):
+        return finishSeedHists(*self.hists)
+
+# The sim-matched electron tracks of one entry, as the table of
+# columnar.selectSeedElectrons (None if there are none)
+def seedElectronTable(events):
+
+    usedSimIdx = dedup.Bitmap(len(events.sim_pdgId)) # Apparently we have an irritating duplication of tracks in electronGsfTracks.
+                                                      # I should fix that in the next version 
+    electronIdxs = []
+    electronSeedIdxs = []
+    with instrument.stage('branches'):
         for seedIdx, simIdxs in zip(events.trk_seedIdx, events.trk_simTrkIdx):
             if len(simIdxs) > 0:                                                     # sim-matched 
-                if usedSimIdx.count(simIdxs[0]) > 0:                                 # discard duplicated entries
+                if simIdxs[0] in usedSimIdx:                                         # discard duplicated entries
                     continue
-                if TMath.Abs(events.sim_pdgId[simIdxs[0]]) == 11:                    # matched to electrons
-                    usedSimIdx.append(simIdxs[0])
-                    simVec = Math.PxPyPzMVector(events.sim_px[simIdxs[0]],
-                                                events.sim_py[simIdxs[0]],
-                                                events.sim_pz[simIdxs[0]],
-                                                0.000511)
-                    
-                    etaCategory = getBin(TMath.Abs(simVec.eta()),etaCategories)
-                    if events.see_ecalDriven[seedIdx]:                               
-                        ptALLSeedHist.Fill(simVec.pt(), simVec.eta(), 0)
-                        ptALLSeedHistEtaCategories[etaCategory].Fill(simVec.pt(), simVec.eta(), 0)
-                        if simVec.pt() > 10.: etaALLSeedHist.Fill(simVec.eta(), simVec.eta(), 0)
-                        algo = events.see_algoOriginal[seedIdx]
-                        ptECALdrivenSeedHist.Fill(simVec.pt(), simVec.eta(), algo)
-                        if simVec.pt() > 10.: etaECALdrivenSeedHist.Fill(simVec.eta(), simVec.eta(), algo)
-                    else:
-                        ptALLSeedHist.Fill(simVec.pt(), simVec.eta(), 1)
-                        ptALLSeedHistEtaCategories[etaCategory].Fill(simVec.pt(), simVec.eta(), 1)
-                        if simVec.pt() > 10.: etaALLSeedHist.Fill(simVec.eta(), simVec.eta(), 1)
-
-    ptECALdrivenLegend = ptECALdrivenSeedHist.MakeLegend(0.55, 0.15, 0.85, 0.55, colorSeven)
-    etaECALdrivenLegend = etaECALdrivenSeedHist.MakeLegend(0.55, 0.15, 0.85, 0.55, colorSeven)
-
-    ptECALdrivenStack  = ptECALdrivenSeedHist.MakeStack(';Simulated Transverse Momentum [GeV];Fraction of Reconstructed GsfElectrons', colorSeven)
-    etaECALdrivenStack = etaECALdrivenSeedHist.MakeStack(';Simulated Pseudorapidity;Fraction of Reconstructed GsfElectrons', colorSeven)
-        
-    ptECALdrivenStack.SetMaximum(1)
-    etaECALdrivenStack.SetMaximum(1)
+                if abs(events.sim_pdgId[simIdxs[0]]) == 11:                          # matched to electrons
+                    usedSimIdx.Add(simIdxs[0])
+                    electronIdxs.append(simIdxs[0])
+                    electronSeedIdxs.append(seedIdx)
+        if len(electronIdxs) == 0: return None
+        px = np.array([events.sim_px[simIdx] for simIdx in electronIdxs])
+        py = np.array([events.sim_py[simIdx] for simIdx in electronIdxs])
+        pz = np.array([events.sim_pz[simIdx] for simIdx in electronIdxs])
+        ecalDriven = np.array([bool(events.see_ecalDriven[seedIdx]) for seedIdx in electronSeedIdxs])
+        algo = np.array([events.see_algoOriginal[seedIdx] for seedIdx in electronSeedIdxs])
 
-    ptALLLegend = ptALLSeedHist.MakeLegend(0.55, 0.15, 0.85, 0.35, colorTwo)
-    etaALLLegend = etaALLSeedHist.MakeLegend(0.55, 0.15, 0.85, 0.35, colorTwo)
+    # kinematics of all the electrons of the event at once
+    with instrument.stage('kinematics'):
+        pt, eta = kinematics.pt(px, py), kinematics.eta(px, py, pz)
+    return {'pt' : pt, 'eta' : eta, 'ecalDriven' : ecalDriven, 'algo' : algo}
 
-    ptALLStack  = ptALLSeedHist.MakeStack(';Simulated Transverse Momentum [GeV];Fraction of Reconstructed GsfElectrons', colorTwo)
-    etaALLStack = etaALLSeedHist.MakeStack(';Simulated Pseudorapidity;Fraction of Reconstructed GsfElectrons', colorTwo)
-        
-    ptALLStack.SetMaximum(1)
-    etaALLStack.SetMaximum(1)
+def inputFileList(inputDir = defaultInputDir, nFiles = defaultNFiles):
+
+    return ['%s/trackingNtuple_%d.root' % (inputDir, x) for x in xrange(1,nFiles+1)]
 
-    ptALLLegendEta0 = ptALLSeedHistEtaCategories[0].MakeLegend(0.55, 0.15, 0.85, 0.35, colorTwo)
-    ptALLStackEta0  = ptALLSeedHistEtaCategories[0].MakeStack(';Simulated Transverse Momentum [GeV];Fraction of Reconstructed GsfElectrons', colorTwo)
-    ptALLStackEta0.SetMaximum(1)
+def makeChain(inputFiles):
 
-    ptALLLegendEta1 = ptALLSeedHistEtaCategories[1].MakeLegend(0.55, 0.15, 0.85, 0.35, colorTwo)
-    ptALLStackEta1  = ptALLSeedHistEtaCategories[1].MakeStack(';Simulated Transverse Momentum [GeV];Fraction of Reconstructed GsfElectrons', colorTwo)
-    ptALLStackEta1.SetMaximum(1)
+    chain = rt.TChain(columnar.treeName)
+    for inputFile in inputFiles:
+        chain.Add(inputFile)
+    return chain
 
-    ptALLLegendEta2 = ptALLSeedHistEtaCategories[2].MakeLegend(0.55, 0.15, 0.85, 0.35, colorTwo)
-    ptALLStackEta2  = ptALLSeedHistEtaCategories[2].MakeStack(';Simulated Transverse Momentum [GeV];Fraction of Reconstructed GsfElectrons', colorTwo)
-    ptALLStackEta2.SetMaximum(1)
+def analyzeSeeds(chain):
 
-    ptALLLegendEta3 = ptALLSeedHistEtaCategories[3].MakeLegend(0.55, 0.15, 0.85, 0.35, colorTwo)
-    ptALLStackEta3  = ptALLSeedHistEtaCategories[3].MakeStack(';Simulated Transverse Momentum [GeV];Fraction of Reconstructed GsfElectrons', colorTwo)
-    ptALLStackEta2.SetMaximum(1)
+    analysis = SeedAnalysis()
+    scheduler.Pass([analysis]).Run(chain)
+    return analysis.Finish()
+
+# Same as analyzeSeeds, but reading the input files in chunks of entries and
+# selecting the electrons with array operations (see columnar.py); with
+# maxMemory, the chunks are sized to stay within that many bytes
+def analyzeSeedsColumnar(inputFiles, chunkSize = 10000, maxMemory = None):
+
+    analysis = SeedAnalysis()
+    scheduler.Pass([analysis]).RunColumnar(inputFiles, chunkSize, maxMemory)
+    return analysis.Finish()
+
+# Same as analyzeSeeds, with the selection JIT-compiled in an RDataFrame and the
+# event loop spread over nThreads threads (0: all cores, see rdf.py)
+def analyzeSeedsRDF(inputFiles, nThreads = 0):
+
+    hists = bookSeedHists()
+    rdf.fillSeedHists(inputFiles, hists, defaultCuts, nThreads)
+    return finishSeedHists(*hists)
+
+# Columns the seed histogram sets are filled from, derived from the electron table
+def seedColumns(electrons, cuts = defaultCuts):
+
+    return {'pt'          : electrons['pt'],
+            'eta'         : electrons['eta'],
+            'etaCategory' : getBin(np.abs(electrons['eta']), cuts['etaCategories']),
+            'seedType'    : np.where(electrons['ecalDriven'], 0, 1),
+            'algo'        : electrons['algo'],
+            'highPt'      : electrons['pt'] > cuts['ptThreshold']}
+
+def fillSeedHists(electrons, ptSeedHists, etaSeedHists, cuts = defaultCuts):
+
+    columns = seedColumns(electrons, cuts)
+    for hist in (ptSeedHists, etaSeedHists):
+        hist.Fill(columns)
+
+# Declarative description of the seed composition figures, as projections of
+# the histogram sets rebinned to binnings (default: makeBinnings()); names
+# start with prefix
+def seedPlots(ptSeedHists, etaSeedHists, binnings = None, cuts = defaultCuts, prefix = ''):
+
+    ptBinning, etaBinning = binnings or makeBinnings()
+    ptTitle = ';Simulated Transverse Momentum [GeV];Fraction of Reconstructed GsfElectrons'
+    etaTitle = ';Simulated Pseudorapidity;Fraction of Reconstructed GsfElectrons'
+    plots = [Plot(prefix+'ptECALdrivenHist', ptSeedHists.Project(prefix+'ptECALdrivenSeedHist', 'pt', 'algo', seedType=0), ptTitle, colorSeven, (0.55, 0.15, 0.85, 0.55), colorSeven, logx = True, binning = ptBinning),
+             Plot(prefix+'etaECALdrivenHist', etaSeedHists.Project(prefix+'etaECALdrivenSeedHist', 'eta', 'algo', seedType=0), etaTitle, colorSeven, (0.55, 0.15, 0.85, 0.55), colorSeven, binning = etaBinning),
+             Plot(prefix+'ptALLHist', ptSeedHists.Project(prefix+'ptALLSeedHist', 'pt', 'seedType'), ptTitle, colorTwo, (0.55, 0.15, 0.85, 0.35), colorTwo, logx = True, binning = ptBinning),
+             Plot(prefix+'etaALLHist', etaSeedHists.Project(prefix+'etaALLSeedHist', 'eta', 'seedType'), etaTitle, colorTwo, (0.55, 0.15, 0.85, 0.35), colorTwo, binning = etaBinning)]
+    # In eta categories
+    for etaCategory in xrange(len(cuts['etaCategories'])-1):
+        plots.append(Plot(prefix+'ptALLHistEta%d' % etaCategory, ptSeedHists.Project(prefix+'ptALLSeedHistEta%d' % (etaCategory+1), 'pt', 'seedType', etaCategory=etaCategory),
+                          ptTitle, colorTwo, (0.55, 0.15, 0.85, 0.35), colorTwo, logx = True, binning = ptBinning))
+    return plots
 
-    ptALLLegendEta4 = ptALLSeedHistEtaCategories[4].MakeLegend(0.55, 0.15, 0.85, 0.35, colorTwo)
-    ptALLStackEta4  = ptALLSeedHistEtaCategories[4].MakeStack(';Simulated Transverse Momentum [GeV];Fraction of Reconstructed GsfElectrons', colorTwo)
-    ptALLStackEta2.SetMaximum(1)
+def finishSeedHists(*hists):
 
-    return (ptECALdrivenStack, ptECALdrivenLegend, etaECALdrivenStack, etaECALdrivenLegend, ptALLStack, ptALLLegend, etaALLStack, etaALLLegend, ptALLStackEta0, ptALLLegendEta0, ptALLStackEta1, ptALLLegendEta1, ptALLStackEta2, ptALLLegendEta2, ptALLStackEta3, ptALLLegendEta3, ptALLStackEta4, ptALLLegendEta4)
+    return makeStacksAndLegends(seedPlots(*hists))
 
-def analyzeECALdrivenEfficiency(chain):
+def bookEfficiencyHists(prefix = ''):
 
-    # Define the binning to be logarithmic uniform
-    ptBinning = [0.5]
-    etaBinning = [-2.5]
-    for i in xrange(1,51):
-        ptBinning.append(TMath.Power(10,TMath.Log10(5)-1+i*(TMath.Log10(2)+2.-TMath.Log10(5)+1.)/50))
-        etaBinning.append(-2.5+(i*5.)/50.)
+    ptBinning, etaBinning = masterBinnings()
         
     # Add histograms
-    ptECALdrivenSeedEff = EffHistograms('ptECALdrivenSeedEff', ptBinning, seedNames)
-    etaECALdrivenSeedEff = EffHistograms('etaECALdrivenSeedEff', etaBinning, seedNames)
-
-    nentries = chain.GetEntries()
-    for ientry, events in enumerate(chain):
-        if ientry % 1000 == 0:
-            print '%d / %d' % (ientry, nentries)
-        for trkIdxs, shareFracs, px, py, pz, pdgId, vtxIdx in zip(events.sim_trkIdx, events.sim_shareFrac, events.sim_px, events.sim_py, events.sim_pz, events.sim_pdgId, events.sim_parentVtxIdx):
-            if TMath.Abs(pdgId) == 11 and len(events.simvtx_sourceSimIdx[vtxIdx]) == 0:             # an electron that comes from the pp interaction
-                simVec = Math.PxPyPzMVector(px, py, pz, 0.000511)
-                if TMath.Abs(simVec.eta()) > 2.5: continue
-                wgt = 0.
+    ptECALdrivenSeedEff = histogramsType(prefix+'ptECALdrivenSeedEff', ptBinning, seedNames)
+    etaECALdrivenSeedEff = histogramsType(prefix+'etaECALdrivenSeedEff', etaBinning, seedNames)
+
+    return ptECALdrivenSeedEff, etaECALdrivenSeedEff
+
+# The ECAL-driven seeding efficiency study, as an analysis of a scheduler.Pass
+class EfficiencyAnalysis:
+
+    branches = columnar.efficiencyBranches
+
+    def __init__(self):
+        self.hists = bookEfficiencyHists()
+
+    def Fill(self, events, tables):
+        electrons = tables.Get('sims', simElectronTable)
+        if electrons is not None:
+            self.FillTable(electrons)
+
+    def FillChunk(self, chunk, tables):
+        with instrument.stage('select'):
+            electrons = tables.Get('sims', columnar.selectSimElectrons)
+        self.FillTable(electrons)
+
+    def FillTable(self, electrons):
+        with instrument.stage('fill'):
+            fillEfficiencyHists(electrons, *self.hists)
+
+    def Key(self):
+        return defaultCuts
+
+    def Finish(self):
+        return finishEfficiencyHists(*self.hists)
+
+# The sim electrons from the pp interaction of one entry with the seed of
+# their first track, as the table of columnar.selectSimElectrons (None if
+# there are none)
+def simElectronTable(events):
+
+    electrons = []
+    with instrument.stage('branches'):
+        for trkIdxs, px, py, pz, pdgId, vtxIdx in zip(events.sim_trkIdx, events.sim_px, events.sim_py, events.sim_pz, events.sim_pdgId, events.sim_parentVtxIdx):
+            if abs(pdgId) == 11 and len(events.simvtx_sourceSimIdx[vtxIdx]) == 0:                   # an electron that comes from the pp interaction
+                ecalDriven = False
                 algo = 0
                 if len(trkIdxs) > 0:
                     seedIdx = events.trk_seedIdx[trkIdxs[0]]
-                    if events.see_ecalDriven[seedIdx]:                 
-                        wgt = 1.
+                    if events.see_ecalDriven[seedIdx]:
+                        ecalDriven = True
                         algo = events.see_algoOriginal[seedIdx]
-                ptECALdrivenSeedEff.Fill(simVec.pt(), simVec.eta(), algo, wgt)
-                if simVec.pt() > 10: etaECALdrivenSeedEff.Fill(simVec.eta(), simVec.eta(), algo, wgt)
+                electrons.append((px, py, pz, ecalDriven, algo))
+    if len(electrons) == 0: return None
+
+    # kinematics of all the electrons of the event at once
+    with instrument.stage('kinematics'):
+        px = np.array([electron[0] for electron in electrons])
+        py = np.array([electron[1] for electron in electrons])
+        pz = np.array([electron[2] for electron in electrons])
+        return {'pt'         : kinematics.pt(px, py),
+                'eta'        : kinematics.eta(px, py, pz),
+                'primary'    : np.ones(len(electrons), dtype=bool),
+                'ecalDriven' : np.array([electron[3] for electron in electrons], dtype=bool),
+                'algo'       : np.array([electron[4] for electron in electrons], dtype=np.int64)}
 
-    ptECALdrivenEffLegend = ptECALdrivenSeedEff.MakeLegend(0.15, 0.49, 0.45, 0.89, None)
-    etaECALdrivenEffLegend = etaECALdrivenSeedEff.MakeLegend(0.55, 0.15, 0.85, 0.55, colorSeven)
+def analyzeECALdrivenEfficiency(chain):
 
-    ptECALdrivenEffStack  = ptECALdrivenSeedEff.MakeStack(';Simulated Transverse Momentum [GeV];Fraction of Simulated GsfElectrons', colorSeven)
-    etaECALdrivenEffStack = etaECALdrivenSeedEff.MakeStack(';Simulated Pseudorapidity;Fraction of Simulated GsfElectrons', colorSeven)
-    
-    ptECALdrivenEffStack.SetMaximum(1)
-    etaECALdrivenEffStack.SetMaximum(1)
+    analysis = EfficiencyAnalysis()
+    scheduler.Pass([analysis]).Run(chain)
+    return analysis.Finish()
 
-    return (ptECALdrivenEffStack, ptECALdrivenEffLegend, etaECALdrivenEffStack, etaECALdrivenEffLegend)
-
-    
+# Same as analyzeECALdrivenEfficiency, with the sim -> vertex -> track -> seed
+# index chain resolved for a whole chunk of entries at once (see columnar.py)
+def analyzeECALdrivenEfficiencyColumnar(inputFiles, chunkSize = 10000, maxMemory = None):
+
+    analysis = EfficiencyAnalysis()
+    scheduler.Pass([analysis]).RunColumnar(inputFiles, chunkSize, maxMemory)
+    return analysis.Finish()
+
+# Columns the efficiency histograms are filled from: the accepted electrons of
+# the table, with weight 1 (and their algo) if their seed is ECAL-driven
+def efficiencyColumns(electrons, cuts = defaultCuts):
+
+    selected = electrons['primary'] & ~(np.abs(electrons['eta']) > cuts['maxEta'])
+    pt, eta = electrons['pt'][selected], electrons['eta'][selected]
+    ecalDriven = electrons['ecalDriven'][selected]
+    return {'pt'     : pt,
+            'eta'    : eta,
+            'wgt'    : np.where(ecalDriven, 1., 0.),
+            'algo'   : np.where(ecalDriven, electrons['algo'][selected], 0),
+            'highPt' : pt > cuts['ptThreshold']}
+
+# Fill the efficiency histograms from per-electron columns, in the order of analyzeECALdrivenEfficiency
+def fillEfficiencyHists(electrons, ptECALdrivenSeedEff, etaECALdrivenSeedEff, cuts = defaultCuts):
+
+    columns = efficiencyColumns(electrons, cuts)
+    highPt = columns['highPt']
+    ptECALdrivenSeedEff.FillN(columns['pt'], columns['algo'], columns['wgt'])
+    etaECALdrivenSeedEff.FillN(columns['eta'][highPt], columns['algo'][highPt], columns['wgt'][highPt])
+
+# Declarative description of the ECAL-driven efficiency figures, rebinned to
+# binnings (default: makeBinnings()); names start with prefix
+def efficiencyPlots(ptECALdrivenSeedEff, etaECALdrivenSeedEff, binnings = None, prefix = ''):
+
+    ptBinning, etaBinning = binnings or makeBinnings()
+    return [Plot(prefix+'ptECALdrivenEffHist', ptECALdrivenSeedEff, ';Simulated Transverse Momentum [GeV];Fraction of Simulated GsfElectrons', colorSeven, (0.15, 0.49, 0.45, 0.89), None, logx = True, binning = ptBinning),
+            Plot(prefix+'etaECALdrivenEffHist', etaECALdrivenSeedEff, ';Simulated Pseudorapidity;Fraction of Simulated GsfElectrons', colorSeven, (0.55, 0.15, 0.85, 0.55), colorSeven, binning = etaBinning)]
+
+def finishEfficiencyHists(*hists):
+
+    return makeStacksAndLegends(efficiencyPlots(*hists))
+
+# Cut variations of the scan mode: list of (name, cuts), set before the
+# ScanAnalysis is created (worker processes inherit it)
+cutVariations = []
+
+# cuts of a variation: defaultCuts with some of its values replaced
+def makeCuts(**values):
+
+    for name in values:
+        if name not in defaultCuts:
+            raise ValueError('unknown cut %s, the cuts are %s' % (name, ', '.join(sorted(defaultCuts))))
+    return dict(defaultCuts, **values)
+
+# variations from a JSON list of {"name" : ..., <cut> : <value>, ...}
+def loadVariations(path):
+
+    import json
+    with open(path) as variationsFile:
+        variations = json.load(variationsFile)
+    return [(str(variation.pop('name')), makeCuts(**dict((str(name), value) for name, value in variation.iteritems())))
+            for variation in variations]
+
+# Both studies for every cut variation, filled from the same electron tables:
+# the selections differ only by boolean masks over the candidates, so a scan
+# costs one read and one selection of the input
+class ScanAnalysis:
+
+    branches = columnar.seedBranches + [branch for branch in columnar.efficiencyBranches if branch not in columnar.seedBranches]
+
+    def __init__(self):
+        self.variations = list(cutVariations)
+        self.hists = [(bookEfficiencyHists('scan_%s_' % name), bookSeedHists(cuts)) for name, cuts in self.variations]
+
+    # the tables are those the nominal analyses of the pass selected already
+    def Fill(self, events, tables):
+        self.FillTables(tables.Get('seeds', seedElectronTable), tables.Get('sims', simElectronTable))
+
+    def FillChunk(self, chunk, tables):
+        with instrument.stage('select'):
+            seeds = tables.Get('seeds', columnar.selectSeedElectrons)
+            sims = tables.Get('sims', columnar.selectSimElectrons)
+        self.FillTables(seeds, sims)
+
+    def FillTables(self, seeds, sims):
+        with instrument.stage('fill'):
+            for (name, cuts), (efficiencyHists, seedHists) in zip(self.variations, self.hists):
+                if sims is not None:
+                    fillEfficiencyHists(sims, *efficiencyHists, cuts=cuts)
+                if seeds is not None:
+                    fillSeedHists(seeds, *seedHists, cuts=cuts)
+
+    def Key(self):
+        return self.variations
+
+    def Finish(self):
+        return makeStacksAndLegends(scanPlots(self.variations, self.hists))
+
+# The efficiency and seed composition figures of every variation, named scan_<variation>_<figure>
+def scanPlots(variations, hists, binnings = None):
+
+    plots = []
+    for (name, cuts), (efficiencyHists, seedHists) in zip(variations, hists):
+        prefix = 'scan_%s_' % name
+        plots += efficiencyPlots(*efficiencyHists, binnings=binnings, prefix=prefix)
+        plots += seedPlots(*seedHists, binnings=binnings, cuts=cuts, prefix=prefix)
+    return plots
 
 if __name__ == '__main__':
 
-    inputFiles = ['/eos/uscms/store/user/rclsa/GsfTrackingNtuple/ValTrkGSF_1_0/DYJetsToLL_M-50_TuneCUETP8M1_13TeV-madgraphMLM-pythia8/trackingNtuple_%d.root' % x for x in xrange(1,786)]
-    inputChain = TChain('trackingNtuple/tree')
-    for inputFile in inputFiles:
-        inputChain.Add(inputFile)
-
-    setupGraphics()
-
-    ptECALdrivenEffStack, ptECALdrivenEffLegend, etaECALdrivenEffStack, etaECALdrivenEffLegend = analyzeECALdrivenEfficiency(inputChain)
-    ptECALdrivenEffCanvas = printHist(ptECALdrivenEffStack, ptECALdrivenEffLegend)
-    ptECALdrivenEffCanvas.SetLogx(1)
-    ptECALdrivenEffCanvas.Update()
-    ptECALdrivenEffCanvas.Print('ptECALdrivenEffHist.png')
-    ptECALdrivenEffCanvas.Print('ptECALdrivenEffHist.pdf')
-    etaECALdrivenEffCanvas = printHist(etaECALdrivenEffStack, etaECALdrivenEffLegend)
-    etaECALdrivenEffCanvas.Print('etaECALdrivenEffHist.png')
-    etaECALdrivenEffCanvas.Print('etaECALdrivenEffHist.pdf')
-
-    ptECALdrivenStack, ptECALdrivenLegend, etaECALdrivenStack, etaECALdrivenLegend, ptALLStack, ptALLLegend, etaALLStack, etaALLLegend, ptALLStackEta0, ptALLLegendEta0, ptALLStackEta1, ptALLLegendEta1, ptALLStackEta2, ptALLLegendEta2, ptALLStackEta3, ptALLLegendEta3, ptALLStackEta4, ptALLLegendEta4 = analyzeSeeds(inputChain)
-    ptECALdrivenCanvas = printHist(ptECALdrivenStack, ptECALdrivenLegend)
-    ptECALdrivenCanvas.SetLogx(1)
-    ptECALdrivenCanvas.Update()
-    ptECALdrivenCanvas.Print('ptECALdrivenHist.png')
-    ptECALdrivenCanvas.Print('ptECALdrivenHist.pdf')
-    etaECALdrivenCanvas = printHist(etaECALdrivenStack, etaECALdrivenLegend)
-    etaECALdrivenCanvas.Print('etaECALdrivenHist.png')
-    etaECALdrivenCanvas.Print('etaECALdrivenHist.pdf')
-    ptALLCanvas = printHist(ptALLStack, ptALLLegend)
-    ptALLCanvas.SetLogx(1)
-    ptALLCanvas.Update()
-    ptALLCanvas.Print('ptALLHist.png')
-    ptALLCanvas.Print('ptALLHist.pdf')
-    etaALLCanvas = printHist(etaALLStack, etaALLLegend)
-    etaALLCanvas.Print('etaALLHist.png')
-    etaALLCanvas.Print('etaALLHist.pdf')
-
-    ptALLCanvasEta0 = printHist(ptALLStackEta0, ptALLLegendEta0)
-    ptALLCanvasEta0.SetLogx(1)
-    ptALLCanvasEta0.Update()
-    ptALLCanvasEta0.Print('ptALLHistEta0.png')
-    ptALLCanvasEta0.Print('ptALLHistEta0.pdf')
-    ptALLCanvasEta1 = printHist(ptALLStackEta1, ptALLLegendEta1)
-    ptALLCanvasEta1.SetLogx(1)
-    ptALLCanvasEta1.Update()
-    ptALLCanvasEta1.Print('ptALLHistEta1.png')
-    ptALLCanvasEta1.Print('ptALLHistEta1.pdf')
-    ptALLCanvasEta2 = printHist(ptALLStackEta2, ptALLLegendEta2)
-    ptALLCanvasEta2.SetLogx(1)
-    ptALLCanvasEta2.Update()
-    ptALLCanvasEta2.Print('ptALLHistEta2.png')
-    ptALLCanvasEta2.Print('ptALLHistEta2.pdf')
-    ptALLCanvasEta3 = printHist(ptALLStackEta3, ptALLLegendEta3)
-    ptALLCanvasEta3.SetLogx(1)
-    ptALLCanvasEta3.Update()
-    ptALLCanvasEta3.Print('ptALLHistEta3.png')
-    ptALLCanvasEta3.Print('ptALLHistEta3.pdf')
-    ptALLCanvasEta4 = printHist(ptALLStackEta4, ptALLLegendEta4)
-    ptALLCanvasEta4.SetLogx(1)
-    ptALLCanvasEta4.Update()
-    ptALLCanvasEta4.Print('ptALLHistEta4.png')
-    ptALLCanvasEta4.Print('ptALLHistEta4.pdf')
-
-    
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backend', choices=['loop', 'columnar', 'rdf'], default='loop',
+                        help='per-entry PyROOT loop, chunked NumPy arrays, or a multithreaded RDataFrame for the seed study (the efficiency study then runs in the loop)')
+    parser.add_argument('--threads', type=int, default=0,
+                        help='threads of the RDataFrame backend (0: all cores)')
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--max-memory', type=memory.parseSize, default=None,
+                        help='memory budget (e.g. 2GB, shared by the workers and the local jobs of --split): the columnar chunks are sized from the measured bytes per entry to fit in it, instead of --chunk-size')
+    parser.add_argument('--histograms', choices=['root', 'array'], default='root',
+                        help='fill TH1Ds directly or NumPy arrays converted to TH1Ds at the end')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes the input files are sharded over')
+    parser.add_argument('--skim-dir', default=None,
+                        help='fill from per-electron tables cached in this directory (skimmed on first use)')
+    parser.add_argument('--store', default=None,
+                        help='keep per-file partial histograms in this directory and only process new or changed files')
+    parser.add_argument('--checkpoint', default=None,
+                        help='checkpoint the filled histograms and completed files to this file, and resume from it')
+    parser.add_argument('--checkpoint-interval', type=float, default=300.,
+                        help='seconds between checkpoints')
+    parser.add_argument('--max-time', type=float, default=None,
+                        help='wall-time limit in seconds: checkpoint and stop before reaching it')
+    parser.add_argument('--retries', type=int, default=1,
+                        help='attempts per input file before quarantining it')
+    parser.add_argument('--retry-quarantined', action='store_true',
+                        help='process again the files quarantined by a previous run')
+    parser.add_argument('--preview', type=int, default=None, metavar='K',
+                        help='fast preview from every K-th cluster of entries of each file, drawn with uncertainty bands')
+    parser.add_argument('--preview-offset', type=int, default=0,
+                        help='first sampled cluster, to draw another sample of the same size')
+    parser.add_argument('--render-workers', type=int, default=1,
+                        help='number of processes drawing the figures')
+    parser.add_argument('--save', default=None,
+                        help='pickle the filled histograms to this file')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='only list the input files')
+    parser.add_argument('--scan', default=None, metavar='JSON',
+                        help='also draw the figures of every cut variation listed in this JSON file, e.g. [{"name": "pt5", "ptThreshold": 5}, {"name": "barrel", "maxEta": 1.444}], filled in the same pass')
+    parser.add_argument('--scan-pt-thresholds', type=float, nargs='*', default=[], metavar='PT',
+                        help='cut variations with these pt thresholds of the eta figures')
+    parser.add_argument('--split', type=int, default=None, metavar='N',
+                        help='split the input into N jobs of balanced entries, run them with --workers local processes and merge their outputs')
+    parser.add_argument('--jobs-dir', default='jobs',
+                        help='directory of the job specs, logs and partial outputs of --split')
+    parser.add_argument('--submit-only', action='store_true',
+                        help='with --split, only write the jobs and their command lines (commands.txt) for the batch system')
+    parser.add_argument('--run-job', default=None,
+                        help='run one job written by --split')
+    parser.add_argument('--merge-only', action='store_true',
+                        help='merge the outputs of the jobs in --jobs-dir and draw the figures')
+    parser.add_argument('--merge-fan-in', type=int, default=4,
+                        help='job outputs added together by each merge of the merge tree')
+    parser.add_argument('--render-only', default=None,
+                        help='only draw the figures, from histograms saved with --save')
+    parser.add_argument('--pt-bins', type=int, default=50,
+                        help='pt bins of the figures, merged from the master histograms (must divide %d)' % (50*masterSplit))
+    parser.add_argument('--pt-scale', choices=['log', 'linear'], default='log')
+    parser.add_argument('--eta-bins', type=int, default=50,
+                        help='eta bins of the figures, merged from the master histograms (must divide %d)' % (50*masterSplit))
+    parser.add_argument('--timing', default=None,
+                        help='write the per-stage timing and I/O summary to this JSON file')
+    parser.add_argument('--input-dir', default=defaultInputDir,
+                        help='directory of the trackingNtuple_*.root input files')
+    parser.add_argument('--nfiles', type=int, default=defaultNFiles,
+                        help='number of input files, trackingNtuple_1.root to trackingNtuple_<nfiles>.root')
+    parser.add_argument('--staging-dir', default=None,
+                        help='copy the input files to this local directory on a background thread before reading them')
+    parser.add_argument('--prefetch', type=int, default=2,
+                        help='number of files staged ahead of the one being analysed')
+    parser.add_argument('--cache-size', type=int, default=0,
+                        help='TTreeCache size in MB for the active branches (0: no cache)')
+    parser.add_argument('--latency', type=float, default=0.,
+                        help='artificial latency in seconds per staged file, to test the prefetching on local files')
+    args = parser.parse_args()
+    if args.backend == 'rdf':
+        # the RDataFrame runs in this process over the whole chain
+        unsupported = [option for option, value in [('--preview', args.preview), ('--split', args.split), ('--skim-dir', args.skim_dir),
+                                                    ('--checkpoint', args.checkpoint), ('--store', args.store), ('--staging-dir', args.staging_dir)]
+                       if value is not None]
+        if args.workers > 1:
+            unsupported.append('--workers')
+        if unsupported:
+            parser.error('--backend rdf cannot be combined with %s' % ', '.join(unsupported))
+    # the staging and the TTreeCache are options of the in-process read of the
+    # input files, which the other run modes replace with their own
+    otherModes = [option for option, value in [('--workers', args.workers > 1 or None), ('--checkpoint', args.checkpoint), ('--store', args.store),
+                                               ('--preview', args.preview), ('--skim-dir', args.skim_dir), ('--split', args.split),
+                                               ('--merge-only', args.merge_only or None)]
+                  if value is not None]
+    if args.staging_dir is not None and otherModes:
+        parser.error('--staging-dir cannot be combined with %s' % ', '.join(otherModes))
+    if args.staging_dir is None and (args.prefetch != parser.get_default('prefetch') or args.latency > 0):
+        parser.error('--prefetch and --latency need --staging-dir')
+    cacheModes = [option for option in otherModes if option not in ('--split', '--merge-only')]
+    if args.cache_size > 0 and cacheModes:
+        parser.error('--cache-size cannot be combined with %s' % ', '.join(cacheModes))
+    if args.histograms == 'array':
+        histogramsType = histograms.ArrayEffHistograms
+    binnings = makeBinnings(args.pt_bins, args.eta_bins, args.pt_scale)
+    # the figures are merged from the master histograms, so their edges must be master edges
+    for option, master, binning in zip(['--pt-bins', '--eta-bins'], masterBinnings(), binnings):
+        try:
+            rebinning.edgeIndices(master, binning)
+        except ValueError as error:
+            parser.error('%s: %s' % (option, error))
+    if args.scan is not None:
+        cutVariations = loadVariations(args.scan)
+    cutVariations += [('pt%g' % threshold, makeCuts(ptThreshold=threshold)) for threshold in args.scan_pt_thresholds]
+    if len(set(name for name, cuts in cutVariations)) != len(cutVariations):
+        sys.exit('The names of the cut variations must be unique')
+
+    # the variations of jobs come from their specs
+    if args.run_job is not None or args.merge_only:
+        spec = jobs.loadSpec(args.run_job or jobs.specPath(args.jobs_dir, 0))
+        cutVariations = [(str(name), dict((str(cut), value) for cut, value in cuts.iteritems())) for name, cuts in spec.get('variations', [])]
+
+    if args.run_job is not None:
+        if spec['histograms'] == 'array':
+            histogramsType = histograms.ArrayEffHistograms
+        jobs.runJob(args.run_job, [EfficiencyAnalysis(), SeedAnalysis()] + ([ScanAnalysis()] if cutVariations else []))
+        sys.exit(0)
+
+    if args.render_only is not None:
+        with open(args.render_only, 'rb') as inputFile:
+            saved = pickle.load(inputFile)
+        efficiencyHists, seedHists = saved[:2]
+        plots = efficiencyPlots(*efficiencyHists, binnings=binnings) + seedPlots(*seedHists, binnings=binnings)
+        if len(saved) > 2:
+            plots += scanPlots(*saved[2], binnings=binnings)
+        rendering.renderPlots(plots, renderPlot, args.render_workers, initializer=setupGraphics)
+        sys.exit(0)
+
+    inputFiles = inputFileList(args.input_dir, args.nfiles)
+    if args.dry_run:
+        for inputFile in inputFiles:
+            print inputFile
+        print '%d input files, %s backend' % (len(inputFiles), args.backend)
+        sys.exit(0)
+
+    # Read the chain once for both studies
+    efficiencyAnalysis = EfficiencyAnalysis()
+    seedAnalysis = SeedAnalysis()
+    scanAnalysis = ScanAnalysis() if cutVariations else None
+    singlePass = scheduler.Pass([efficiencyAnalysis, seedAnalysis] + ([scanAnalysis] if scanAnalysis else []))
+    if args.split is not None or args.merge_only:
+        instrument.timer.Reset()
+        if args.split is not None:
+            entries = jobs.countAllEntries(inputFiles, args.backend, args.workers)
+            options = {'backend'    : args.backend,
+                       'chunkSize'  : args.chunk_size,
+                       'cacheSize'  : args.cache_size*1024*1024,
+                       # the jobs run --workers at a time, each within its share of the budget
+                       'maxMemory'  : scheduler.workerBudget(args.max_memory, args.workers),
+                       'histograms' : args.histograms,
+                       'variations' : cutVariations}
+            specs = jobs.writeJobs(args.jobs_dir, jobs.splitJobs(inputFiles, entries, args.split), dict(zip(inputFiles, entries)), __file__, options)
+            if args.submit_only:
+                print 'Submit the commands of %s/commands.txt, then run with --merge-only' % args.jobs_dir
+                sys.exit(0)
+            failed = jobs.LocalExecutor(args.workers).Run(specs, __file__)
+            if failed:
+                sys.exit('%d jobs failed, run again to retry them' % len(failed))
+        else:
+            specs = jobs.listSpecs(args.jobs_dir)
+        merged = jobs.mergeOutputs(specs, args.jobs_dir, args.merge_fan_in, args.workers)
+        for analysis, hists in zip(singlePass.analyses, merged['hists']):
+            analysis.hists = hists
+        for timing in merged['timings']:
+            instrument.timer.Merge(timing)
+    elif args.preview is not None:
+        singlePass.RunSampled(inputFiles, args.preview, args.preview_offset, args.backend, args.chunk_size)
+    elif args.skim_dir is not None:
+        tables = skim.loadOrSkim(inputFiles, args.skim_dir, args.chunk_size)
+        efficiencyAnalysis.FillTable(tables['sims'])
+        seedAnalysis.FillTable(tables['seeds'])
+        if scanAnalysis:
+            scanAnalysis.FillTables(tables['seeds'], tables['sims'])
+    elif args.backend == 'rdf':
+        scheduler.Pass([efficiencyAnalysis] + ([scanAnalysis] if scanAnalysis else [])).Run(makeChain(inputFiles), args.cache_size*1024*1024, args.max_memory)
+        rdf.fillSeedHists(inputFiles, seedAnalysis.hists, defaultCuts, args.threads)
+    elif args.checkpoint is not None:
+        if not checkpoint.Run(singlePass, inputFiles, args.checkpoint, args.workers, args.backend, args.chunk_size,
+                              args.checkpoint_interval, args.max_time, args.retries, args.retry_quarantined, args.max_memory):
+            sys.exit('Stopped before the end of the input, run again with --checkpoint %s to resume' % args.checkpoint)
+    elif args.store is not None:
+        incremental.ResultStore(args.store).Run(singlePass, inputFiles, args.workers, args.backend, args.chunk_size, args.max_memory)
+    elif args.workers > 1:
+        singlePass.RunParallel(inputFiles, args.workers, args.backend, args.chunk_size, args.max_memory)
+    elif args.staging_dir is not None:
+        reader = prefetch.LatencyReader(args.latency) if args.latency > 0 else None
+        singlePass.RunPrefetched(inputFiles, args.backend, args.chunk_size, args.prefetch, args.staging_dir, args.cache_size*1024*1024, reader, args.max_memory)
+    elif args.backend == 'loop':
+        singlePass.Run(makeChain(inputFiles), args.cache_size*1024*1024, args.max_memory)
+    else:
+        singlePass.RunColumnar(inputFiles, args.chunk_size, args.max_memory)
+    instrument.timer.Print()
+    if args.timing is not None:
+        instrument.timer.Write(args.timing)
+
+    if args.save is not None:
+        with open(args.save, 'wb') as output:
+            saved = (efficiencyAnalysis.hists, seedAnalysis.hists)
+            if scanAnalysis:
+                saved += ((scanAnalysis.variations, scanAnalysis.hists),)
+            pickle.dump(saved, output, pickle.HIGHEST_PROTOCOL)
+
+    plots = efficiencyPlots(*efficiencyAnalysis.hists, binnings=binnings) + seedPlots(*seedAnalysis.hists, binnings=binnings)
+    if scanAnalysis:
+        plots += scanPlots(scanAnalysis.variations, scanAnalysis.hists, binnings)
+    if args.preview is not None:
+        for plot in plots:
+            plot.name = 'preview_' + plot.name
+            plot.bands = True
+    rendering.renderPlots(plots, renderPlot, args.render_workers, initializer=setupGraphics)
@@ -0,0 +1,120 @@
+import os
+import time
+import shutil
+import threading
+import subprocess
+import Queue
+
+import instrument
+from lazyroot import rt
+
+# Input prefetching. A Stager copies the input files to a local scratch
+# directory on a background thread, up to depth files ahead of the one being
+# analysed, so that the transfer from EOS overlaps with the analysis instead of
+# stalling it. Within a file, setupCache gives the chain a TTreeCache restricted
+# to the active branches, with asynchronous basket prefetching and parallel
+# unzipping, so that reading and decompression overlap with the event loop too.
+
+# Copy one input file, through xrdcp for xrootd URLs
+def copyFile(source, destination):
+    if source.startswith('root://'):
+        subprocess.check_call(['xrdcp', '--silent', '--force', source, destination])
+    else:
+        shutil.copyfile(source, destination)
+
+# A reader with artificial latency, to test the prefetching with a local
+# directory standing in for EOS: every file costs latency seconds plus its
+# size over bandwidth (bytes/s, if given) before being copied
+class LatencyReader:
+
+    def __init__(self, latency, bandwidth = None, reader = copyFile):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.reader = reader
+
+    def __call__(self, source, destination):
+        delay = self.latency
+        if self.bandwidth:
+            delay += os.path.getsize(source)/float(self.bandwidth)
+        time.sleep(delay)
+        self.reader(source, destination)
+
+class Stager:
+
+    def __init__(self, inputFiles, stagingDir = None, depth = 2, reader = None, keep = False):
+        self.inputFiles = list(inputFiles)
+        self.stagingDir = stagingDir
+        self.depth = max(1, depth)
+        self.reader = reader or copyFile
+        self.keep = keep
+
+    def LocalPath(self, ifile):
+        return os.path.join(self.stagingDir, '%d_%s' % (ifile, os.path.basename(self.inputFiles[ifile])))
+
+    # background thread: stage the files in order, blocking while depth of them are waiting
+    def Fetch(self, staged, stop):
+        for ifile, inputFile in enumerate(self.inputFiles):
+            try:
+                localPath = self.LocalPath(ifile)
+                start = time.time()
+                self.reader(inputFile, localPath+'.tmp')
+                os.rename(localPath+'.tmp', localPath)
+                instrument.timer.Add('staging (background)', time.time() - start)
+                item = (inputFile, localPath, None)
+            except Exception as error:
+                item = (inputFile, None, error)
+            while not stop.is_set():
+                try:
+                    staged.put(item, timeout=0.1)
+                    break
+                except Queue.Full:
+                    pass
+            else:
+                self.Remove(item[1])
+                return
+            if item[2] is not None:
+                return
+
+    def Remove(self, localPath):
+        if localPath is not None and not self.keep and os.path.exists(localPath):
+            os.remove(localPath)
+
+    # (input file, local path) in input order; a staged copy is removed when
+    # the next one is requested, unless keep is set
+    def __iter__(self):
+        if self.stagingDir is None:
+            for inputFile in self.inputFiles:
+                yield inputFile, inputFile
+            return
+        if not os.path.isdir(self.stagingDir):
+            os.makedirs(self.stagingDir)
+        staged = Queue.Queue(self.depth)
+        stop = threading.Event()
+        thread = threading.Thread(target=self.Fetch, args=(staged, stop))
+        thread.daemon = True
+        thread.start()
+        localPath = None
+        try:
+            for ifile in xrange(len(self.inputFiles)):
+                with instrument.stage('staging (wait)'):
+                    inputFile, localPath, error = staged.get()
+                if error is not None:
+                    raise IOError('could not stage %s: %s' % (inputFile, error))
+                yield inputFile, localPath
+                self.Remove(localPath)
+        finally:
+            stop.set()
+            thread.join()
+            self.Remove(localPath)
+            while not staged.empty():
+                self.Remove(staged.get()[1])
+
+# TTreeCache of cacheSize bytes over the given branches of chain, filled by
+# asynchronous prefetching and unzipped in parallel
+def setupCache(chain, branches, cacheSize):
+    rt.gEnv.SetValue('TFile.AsyncPrefetching', 1)
+    rt.TTreeCacheUnzip.SetParallelUnzip(rt.TTreeCacheUnzip.kEnable)
+    chain.SetCacheSize(cacheSize)
+    for branch in branches:
+        chain.AddBranchToCache(branch, True)
+    chain.StopCacheLearningPhase()
@@ -0,0 +1,153 @@
+import numpy as np
+
+import columnar
+from lazyroot import rt
+
+# RDataFrame backend of the seed composition study. The per-electron columns of
+# myMacro.seedColumns are JIT-compiled C++ column definitions (electron
+# matching with duplicate removal, kinematics with the ROOT conventions, seed
+# type, algo and eta category), and every HistSet is filled as a TH1D over its
+# flattened bin index, so that a single lazy, implicitly multithreaded event
+# loop fills all the histogram sets; the projections into the figures stay in
+# Python and are unchanged.
+
+code = '''
+#include <cmath>
+#include <vector>
+#include <algorithm>
+#include "ROOT/RVec.hxx"
+#include "Math/GenVector/eta.h"
+
+namespace seedRDF {
+
+using ROOT::VecOps::RVec;
+
+// first track of every sim electron, in track order (tracks matched to a sim
+// particle already seen are duplicates)
+template <typename T, typename P>
+RVec<int> electronTracks(const T &trkSimTrkIdx, const P &simPdgId) {
+    RVec<int> tracks;
+    std::vector<char> used(simPdgId.size(), 0);
+    for (int itrk = 0; itrk < (int) trkSimTrkIdx.size(); ++itrk) {
+        if (trkSimTrkIdx[itrk].size() == 0) continue;
+        int isim = trkSimTrkIdx[itrk][0];
+        if (used[isim]) continue;
+        if (std::abs(simPdgId[isim]) == 11) {
+            used[isim] = 1;
+            tracks.push_back(itrk);
+        }
+    }
+    return tracks;
+}
+
+template <typename T>
+RVec<int> firstSims(const T &trkSimTrkIdx, const RVec<int> &tracks) {
+    RVec<int> sims(tracks.size());
+    for (size_t i = 0; i < tracks.size(); ++i) sims[i] = trkSimTrkIdx[tracks[i]][0];
+    return sims;
+}
+
+template <typename V>
+RVec<double> pt(const V &px, const V &py, const RVec<int> &sims) {
+    RVec<double> result(sims.size());
+    for (size_t i = 0; i < sims.size(); ++i) {
+        double x = px[sims[i]], y = py[sims[i]];
+        result[i] = std::sqrt(x*x + y*y);
+    }
+    return result;
+}
+
+template <typename V>
+RVec<double> eta(const RVec<double> &rho, const V &pz, const RVec<int> &sims) {
+    RVec<double> result(sims.size());
+    for (size_t i = 0; i < sims.size(); ++i) result[i] = ROOT::Math::Impl::Eta_FromRhoZ(rho[i], (double) pz[sims[i]]);
+    return result;
+}
+
+// TAxis::FindBin convention: 0 underflow, edges.size() overflow
+inline int findBin(const std::vector<double> &edges, double val) {
+    return std::upper_bound(edges.begin(), edges.end(), val) - edges.begin();
+}
+
+// category index, out-of-range values in the extra slot n
+inline int categoryIndex(long val, int n) {
+    return (val >= 0 && val < n) ? val : n;
+}
+
+}
+'''
+
+_declared = []
+
+def declare():
+    if not _declared:
+        rt.gInterpreter.Declare(code)
+        _declared.append(True)
+
+# The columns of myMacro.seedColumns with the given cuts (see myMacro.defaultCuts),
+# as RVec columns with one entry per electron
+def defineSeedColumns(dataFrame, cuts):
+    edges = ', '.join('%.17g' % edge for edge in cuts['etaCategories'])
+    return (dataFrame
+            .Define('eTrk', 'seedRDF::electronTracks(trk_simTrkIdx, sim_pdgId)')
+            .Define('eSim', 'seedRDF::firstSims(trk_simTrkIdx, eTrk)')
+            .Define('eSeed', 'ROOT::VecOps::RVec<int> seeds(eTrk.size()); for (size_t i = 0; i < eTrk.size(); ++i) seeds[i] = trk_seedIdx[eTrk[i]]; return seeds;')
+            .Define('pt', 'seedRDF::pt(sim_px, sim_py, eSim)')
+            .Define('eta', 'seedRDF::eta(pt, sim_pz, eSim)')
+            .Define('etaCategory', 'static const std::vector<double> edges = {%s}; '
+                                   'ROOT::VecOps::RVec<int> cats(eta.size()); '
+                                   'for (size_t i = 0; i < eta.size(); ++i) cats[i] = std::min(seedRDF::findBin(edges, std::abs(eta[i])) - 1, (int) edges.size() - 2); '
+                                   'return cats;' % edges)
+            .Define('seedType', 'ROOT::VecOps::RVec<int> types(eSeed.size()); for (size_t i = 0; i < eSeed.size(); ++i) types[i] = see_ecalDriven[eSeed[i]] ? 0 : 1; return types;')
+            .Define('algo', 'ROOT::VecOps::RVec<int> algos(eSeed.size()); for (size_t i = 0; i < eSeed.size(); ++i) algos[i] = see_algoOriginal[eSeed[i]]; return algos;')
+            .Define('highPt', 'pt > %.17g' % cuts['ptThreshold']))
+
+# C++ body computing the flattened bin index (as in HistSet.Fill) of every
+# selected electron
+def flatIndexCode(histSet):
+    shape = [axis.size for axis in histSet.axes]
+    lines = []
+    terms = []
+    for iaxis, axis in enumerate(histSet.axes):
+        stride = int(np.prod(shape[iaxis+1:]))
+        if axis.labels is None:
+            lines.append('static const std::vector<double> edges%d = {%s};' % (iaxis, ', '.join('%.17g' % edge for edge in axis.edges)))
+            terms.append('seedRDF::findBin(edges%d, %s[i])*%d' % (iaxis, axis.column, stride))
+        else:
+            terms.append('seedRDF::categoryIndex(%s[i], %d)*%d' % (axis.column, len(axis.labels), stride))
+    selection = 'if (!%s[i]) continue; ' % histSet.selection if histSet.selection is not None else ''
+    lines.append('ROOT::VecOps::RVec<double> flat; flat.reserve(%s.size());' % histSet.axes[0].column)
+    lines.append('for (size_t i = 0; i < %s.size(); ++i) { %sflat.push_back(%s); }' % (histSet.axes[0].column, selection, ' + '.join(terms)))
+    lines.append('return flat;')
+    return ' '.join(lines)
+
+# Book one TH1D per HistSet over its flattened bin index; returns the lazy results
+def bookHistSets(dataFrame, histSets):
+    results = []
+    for histSet in histSets:
+        column = 'flat_' + histSet.name
+        size = histSet.entries.size
+        dataFrame = dataFrame.Define(column, flatIndexCode(histSet))
+        results.append(dataFrame.Histo1D(rt.RDF.TH1DModel('rdf_' + histSet.name, '', size, 0., size), column))
+    return results
+
+# Fill histSets (the seed histogram sets of cuts, unweighted) from inputFiles in
+# one event loop over nThreads threads (0: all cores)
+def fillSeedHists(inputFiles, histSets, cuts, nThreads = 0):
+    declare()
+    rt.EnableImplicitMT(nThreads)
+    # the thread pool is global: release it for the ROOT code that runs after
+    try:
+        names = rt.std.vector('string')()
+        for inputFile in inputFiles:
+            names.push_back(inputFile)
+        dataFrame = defineSeedColumns(rt.RDataFrame(columnar.treeName, names), cuts)
+        results = bookHistSets(dataFrame, histSets)
+        for histSet, result in zip(histSets, results):
+            hist = result.GetValue()
+            counts = np.array([hist.GetBinContent(ibin) for ibin in xrange(1, histSet.entries.size+1)]).reshape(histSet.entries.shape)
+            histSet.entries += counts
+            histSet.sumw += counts
+            histSet.sumw2 += counts
+    finally:
+        rt.DisableImplicitMT()
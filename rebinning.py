@@ -0,0 +1,55 @@
+import numpy as np
+
+# Exact rebinning of fine "master" histograms. The analyses fill their
+# histograms once with master binnings whose edges include those of every
+# binning the figures may ask for; a coarser binning is then derived by summing
+# adjacent bins of the arrays (under- and overflow included, TAxis::FindBin
+# convention), which gives the same contents as filling it directly, without
+# reading the ntuples again.
+
+# edges closer than this (relative, absolute below 1) are the same edge
+tolerance = 1e-9
+
+# every bin of edges split in factor bins, of equal width in log scale if log
+def subdivide(edges, factor, log = False):
+    edges = np.asarray(edges, dtype=np.float64)
+    steps = np.arange(factor)/float(factor)
+    if log:
+        inner = edges[:-1,None]*np.power(edges[1:,None]/edges[:-1,None], steps)
+    else:
+        inner = edges[:-1,None] + (edges[1:,None] - edges[:-1,None])*steps
+    return np.append(inner.ravel(), edges[-1])
+
+def _nearest(master, edges):
+    index = np.clip(np.searchsorted(master, edges), 1, len(master)-1)
+    return np.where(edges - master[index-1] < master[index] - edges, index-1, index)
+
+def _close(a, b):
+    return np.abs(a - b) <= tolerance*np.maximum(np.abs(b), 1.)
+
+# sorted union of binnings; edges of the later ones that coincide with an
+# earlier edge are dropped, so that the earlier edges are kept exactly
+def union(edges, *others):
+    edges = np.asarray(edges, dtype=np.float64)
+    for other in others:
+        other = np.asarray(other, dtype=np.float64)
+        edges = np.union1d(edges, other[~_close(edges[_nearest(edges, other)], other)])
+    return edges
+
+# indices in master of edges, which must be increasing master edges
+def edgeIndices(master, edges):
+    master = np.asarray(master, dtype=np.float64)
+    edges = np.asarray(edges, dtype=np.float64)
+    index = _nearest(master, edges)
+    missing = ~_close(master[index], edges)
+    if missing.any():
+        raise ValueError('bin edge %g is not an edge of the master binning' % edges[missing][0])
+    if len(index) < 2 or (np.diff(index) <= 0).any():
+        raise ValueError('bin edges must be increasing')
+    return index
+
+# values: (..., len(master)+1) bins -> (..., len(edges)+1) bins; master bins
+# below the first or above the last edge go to the under- or overflow
+def rebin(values, master, edges):
+    index = edgeIndices(master, edges)
+    return np.add.reduceat(values, np.concatenate([[0], index+1]), axis=-1)
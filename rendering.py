@@ -0,0 +1,50 @@
+import hashlib
+import json
+import multiprocessing
+import os
+
+# Rendering stage for a declarative list of plots (see myMacro.Plot). Each plot
+# is keyed by a hash of its style and of the content of its histograms; plots
+# whose hash did not change since the last render and whose outputs are still
+# on disk are skipped, the others are drawn by a pool of worker processes.
+
+def plotHash(plot):
+    digest = hashlib.sha1(repr(plot.Style()))
+    digest.update(plot.hists.Contents().tostring())
+    return digest.hexdigest()
+
+def loadState(stateFile):
+    if not os.path.exists(stateFile):
+        return {}
+    with open(stateFile) as inputFile:
+        return json.load(inputFile)
+
+def saveState(stateFile, state):
+    with open(stateFile + '.tmp', 'w') as output:
+        json.dump(state, output, indent=1, sort_keys=True)
+    os.rename(stateFile + '.tmp', stateFile)
+
+# Draw the plots with render(plot), in nWorkers processes set up by initializer
+def renderPlots(plots, render, nWorkers = 1, stateFile = 'render.json', initializer = None, force = False):
+    state = loadState(stateFile)
+    hashes = dict((plot.name, plotHash(plot)) for plot in plots)
+    todo = [plot for plot in plots
+            if force or state.get(plot.name) != hashes[plot.name] or not all(os.path.exists(output) for output in plot.Outputs())]
+    print 'Rendering %d / %d plots (%d unchanged)' % (len(todo), len(plots), len(plots)-len(todo))
+
+    if nWorkers > 1 and len(todo) > 1:
+        pool = multiprocessing.Pool(min(nWorkers, len(todo)), initializer)
+        try:
+            pool.map(render, todo)
+        finally:
+            pool.close()
+            pool.join()
+    elif len(todo) > 0:
+        if initializer is not None:
+            initializer()
+        for plot in todo:
+            render(plot)
+
+    for plot in todo:
+        state[plot.name] = hashes[plot.name]
+    saveState(stateFile, state)
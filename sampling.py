@@ -0,0 +1,19 @@
+# Cluster-level sampling of the input trees for preview runs. A cluster is the
+# range of entries whose baskets are flushed together, so reading only some
+# clusters skips the baskets of all the others.
+
+# (first entry, last entry + 1) of every cluster of tree
+def clusterRanges(tree):
+    ranges = []
+    nentries = tree.GetEntries()
+    clusters = tree.GetClusterIterator(0)
+    start = clusters.Next()
+    while start < nentries:
+        stop = min(clusters.GetNextEntry(), nentries)
+        ranges.append((start, stop))
+        start = clusters.Next()
+    return ranges
+
+# every every-th cluster, starting from cluster phase
+def selectClusters(ranges, every, phase = 0):
+    return ranges[phase % every::every]
@@ -0,0 +1,315 @@
+import json
+import multiprocessing
+import time
+
+import columnar, instrument, memory, prefetch, sampling
+from lazyroot import rt
+
+# A Pass reads the input once and feeds every registered analysis from the same
+# read. An analysis declares the branches it needs in `branches` and provides
+# Fill(events, tables) for the per-entry PyROOT loop and/or FillChunk(chunk,
+# tables) for the columnar backend; only the union of the declared branches is
+# ever read. tables (SharedTables) selects the electron tables of the entry or
+# chunk once for all the analyses.
+# Its histograms live in `hists` (EffHistograms, possibly in nested lists and
+# tuples), which is what gets merged across worker processes.
+
+# Tables selected from one entry or chunk, shared by the analyses of a pass:
+# select(source) runs for the first analysis that asks for name, the others
+# reuse its result
+class SharedTables:
+
+    def __init__(self, source):
+        self.source = source
+        self.tables = {}
+
+    def Get(self, name, select):
+        if name not in self.tables:
+            self.tables[name] = select(self.source)
+        return self.tables[name]
+
+class Pass:
+
+    def __init__(self, analyses = None):
+        self.analyses = []
+        self.branchBytes = {}
+        self.treeBytes = 0
+        for analysis in analyses or []:
+            self.Register(analysis)
+
+    def Register(self, analysis):
+        self.analyses.append(analysis)
+        return analysis
+
+    def Branches(self):
+        branches = []
+        for analysis in self.analyses:
+            for branch in analysis.branches:
+                if branch not in branches:
+                    branches.append(branch)
+        return branches
+
+    # per-entry loop over a TChain with all the other branches disabled;
+    # cacheSize > 0 reads the active branches through a TTreeCache, of at most
+    # a quarter of maxMemory bytes if given
+    def Run(self, chain, cacheSize = 0, maxMemory = None):
+        instrument.timer.Reset()
+        cacheSize = limitCache(cacheSize, maxMemory)
+        bytesRead = rt.TFile.GetFileBytesRead()
+        self.Loop(chain, cacheSize, chain.GetEntries())
+        print 'Read %.1f MB from disk' % ((rt.TFile.GetFileBytesRead() - bytesRead)/1e6)
+        self.Report()
+
+    # the entries of chain (all of them, or the given entry numbers), counted
+    # after those already processed in this run (out of ntotal, when known)
+    def Loop(self, chain, cacheSize = 0, ntotal = None, entries = None):
+        chain.SetBranchStatus('*', 0)
+        for branch in self.Branches():
+            if not chain.GetBranch(branch):
+                raise ValueError('branch %s is not in the input tree' % branch)
+            chain.SetBranchStatus(branch, 1)
+        if cacheSize > 0:
+            prefetch.setupCache(chain, self.Branches(), cacheSize)
+
+        timer = instrument.timer
+        first = timer.nevents
+        perfStats = rt.TTreePerfStats('ioperf', chain)
+        fileBytes, fileEntry = rt.TFile.GetFileBytesRead(), 0
+        treeNumber = -1
+        if entries is None:
+            entries = xrange(chain.GetEntries())
+        nentries = len(entries)
+        for ientry, entry in enumerate(entries):
+            if ientry % 1000 == 0:
+                timer.Progress(first + ientry, ntotal)
+            beforeRead = rt.TFile.GetFileBytesRead()
+            start = time.time()
+            # 0 bytes for a missing entry, -1 for an I/O error: checkpoint.py retries
+            # the file on IOError and quarantines it if it keeps failing
+            if chain.GetEntry(entry) <= 0:
+                raise IOError('cannot read entry %d of %s' % (entry, chain.GetFile().GetName() if chain.GetFile() else chain.GetName()))
+            events = chain
+            timer.Add('read', time.time() - start)
+            if chain.GetTreeNumber() != treeNumber:
+                if treeNumber >= 0:
+                    timer.AddFile(chain.GetListOfFiles().At(treeNumber).GetTitle(), beforeRead - fileBytes, ientry - fileEntry)
+                fileBytes, fileEntry = beforeRead, ientry
+                treeNumber = chain.GetTreeNumber()
+                self.CountTree(chain.GetTree())
+            tables = SharedTables(events)
+            for analysis in self.analyses:
+                start = time.time()
+                analysis.Fill(events, tables)
+                timer.Add(analysis.__class__.__name__, time.time() - start)
+        if treeNumber >= 0:
+            timer.AddFile(chain.GetListOfFiles().At(treeNumber).GetTitle(), rt.TFile.GetFileBytesRead() - fileBytes, nentries - fileEntry)
+        timer.Progress(first + nentries, ntotal)
+        perfStats.Finish()
+        for name, value in [('bytesRead', perfStats.GetBytesRead()),
+                            ('readCalls', perfStats.GetReadCalls()),
+                            ('diskTime',  perfStats.GetDiskTime()),
+                            ('unzipTime', perfStats.GetUnzipTime()),
+                            ('cpuTime',   perfStats.GetCpuTime()),
+                            ('realTime',  perfStats.GetRealTime())]:
+            timer.io[name] = timer.io.get(name, 0) + value
+
+    # chunked columnar read of the input files, in chunks of chunkSize entries
+    # or, given a memory budget of maxMemory bytes, of the size that fits in it
+    # (see memory.py)
+    def RunColumnar(self, inputFiles, chunkSize = 10000, maxMemory = None):
+        instrument.timer.Reset()
+        self.LoopColumnar(inputFiles, chunkSize, maxMemory)
+        self.Report()
+
+    def LoopColumnar(self, inputFiles, chunkSize = 10000, maxMemory = None):
+        timer = instrument.timer
+        for inputFile in inputFiles:
+            branchBytes, treeBytes = columnar.branchBytes(inputFile, self.Branches())
+            self.AddBytes(branchBytes, treeBytes)
+            timer.AddFile(inputFile, sum(branchBytes.values()), None)
+        if maxMemory is None:
+            self.LoopChunks(columnar.iterateChunks(inputFiles, self.Branches(), chunkSize))
+            return
+        sizer = memory.ChunkSizer(maxMemory)
+        for inputFile in inputFiles:
+            ranges = sizer.Ranges(columnar.numEntries(inputFile))
+            self.LoopChunks(columnar.iterateRanges(inputFile, self.Branches(), ranges), sizer)
+
+    def LoopChunks(self, chunks, sizer = None):
+        timer = instrument.timer
+        nentries = timer.nevents
+        while True:
+            if sizer is not None:
+                sizer.Begin()
+            start = time.time()
+            chunk = next(chunks, None)
+            timer.Add('read', time.time() - start)
+            if chunk is None: break
+            size = len(chunk.values()[0])
+            nentries += size
+            tables = SharedTables(chunk)
+            for analysis in self.analyses:
+                start = time.time()
+                analysis.FillChunk(chunk, tables)
+                timer.Add(analysis.__class__.__name__, time.time() - start)
+            if sizer is not None:
+                sizer.End(chunk, size)
+            # released before the next chunk is read
+            chunk = tables = None
+            timer.Progress(nentries)
+
+    # Preview on a deterministic, stratified sample: every every-th cluster of
+    # entries of each input file, starting from a phase that rotates from file
+    # to file. The baskets of the skipped clusters are never read
+    def RunSampled(self, inputFiles, every, offset = 0, backend = 'loop', chunkSize = 10000):
+        checkBackend(backend)
+        instrument.timer.Reset()
+        nsampled = ntotal = 0
+        for ifile, inputFile in enumerate(inputFiles):
+            phase = (offset + ifile) % every
+            if backend == 'loop':
+                chain = rt.TChain(columnar.treeName)
+                chain.Add(inputFile)
+                chain.LoadTree(0)
+                clusters = sampling.clusterRanges(chain.GetTree())
+                ranges = sampling.selectClusters(clusters, every, phase)
+                self.Loop(chain, 0, None, [entry for start, stop in ranges for entry in xrange(start, stop)])
+            else:
+                clusters = columnar.clusterRanges(inputFile, self.Branches())
+                ranges = sampling.selectClusters(clusters, every, phase)
+                self.LoopChunks(columnar.iterateRanges(inputFile, self.Branches(), ranges))
+            nsampled += sum(stop - start for start, stop in ranges)
+            ntotal += sum(stop - start for start, stop in clusters)
+        print 'Sampled %d of %d entries (%.1f%%)' % (nsampled, ntotal, 100.*nsampled/max(ntotal, 1))
+
+    # Same as Run/RunColumnar, one input file at a time, with the files staged
+    # to stagingDir by a background thread depth files ahead (see prefetch.py)
+    def RunPrefetched(self, inputFiles, backend = 'loop', chunkSize = 10000, depth = 2, stagingDir = None, cacheSize = 0, reader = None, maxMemory = None):
+        checkBackend(backend)
+        instrument.timer.Reset()
+        cacheSize = limitCache(cacheSize, maxMemory)
+        stager = prefetch.Stager(inputFiles, stagingDir, depth, reader)
+        for ifile, (inputFile, localFile) in enumerate(stager):
+            print 'File %d / %d: %s' % (ifile+1, len(inputFiles), inputFile)
+            if backend == 'loop':
+                chain = rt.TChain(columnar.treeName)
+                chain.Add(localFile)
+                self.Loop(chain, cacheSize)
+            else:
+                self.LoopColumnar([localFile], chunkSize, maxMemory)
+        self.Report()
+
+    # compressed size of the active branches of one tree of the chain
+    def CountTree(self, tree):
+        branchBytes = {}
+        for branch in self.Branches():
+            treeBranch = tree.GetBranch(branch)
+            if treeBranch:
+                branchBytes[branch] = treeBranch.GetZipBytes('*')
+        self.AddBytes(branchBytes, tree.GetZipBytes())
+
+    def AddBytes(self, branchBytes, treeBytes):
+        for branch, nbytes in branchBytes.iteritems():
+            self.branchBytes[branch] = self.branchBytes.get(branch, 0) + nbytes
+        self.treeBytes += treeBytes
+
+    # compressed bytes read by each analysis (branches shared between analyses
+    # count for each of them) and by the whole pass, against the full tree
+    def Report(self):
+        if self.treeBytes == 0: return
+        print 'Compressed bytes read per analysis:'
+        for analysis in self.analyses:
+            nbytes = sum(self.branchBytes.get(branch, 0) for branch in analysis.branches)
+            print '    %-24s %10.1f MB' % (analysis.__class__.__name__, nbytes/1e6)
+        nbytes = sum(self.branchBytes.get(branch, 0) for branch in self.Branches())
+        print '    %-24s %10.1f MB of %.1f MB (%.1f%%)' % ('pass', nbytes/1e6, self.treeBytes/1e6, 100.*nbytes/self.treeBytes)
+
+    # Shard the input files over nWorkers processes, each filling its own fresh
+    # copy of the analyses, and add the per-shard histograms back in file order.
+    # A memory budget is shared equally by the workers
+    def RunParallel(self, inputFiles, nWorkers, backend = 'loop', chunkSize = 10000, maxMemory = None):
+        checkBackend(backend)
+        shards = shardFiles(inputFiles, nWorkers)
+        analysisTypes = [analysis.__class__ for analysis in self.analyses]
+        workerMemory = workerBudget(maxMemory, len(shards))
+        pool = multiprocessing.Pool(nWorkers)
+        try:
+            results = pool.map(_runShard, [(analysisTypes, shard, backend, chunkSize, workerMemory) for shard in shards])
+        finally:
+            pool.close()
+            pool.join()
+        instrument.timer.Reset()
+        for shardHists, branchBytes, treeBytes, timing in results:
+            for analysis, hists in zip(self.analyses, shardHists):
+                addHists(analysis.hists, hists)
+            self.AddBytes(branchBytes, treeBytes)
+            instrument.timer.Merge(timing)
+        self.Report()
+
+# Split the file list in nShards contiguous pieces of (almost) equal length
+def shardFiles(inputFiles, nShards):
+    nShards = max(1, min(nShards, len(inputFiles)))
+    size, extra = divmod(len(inputFiles), nShards)
+    shards = []
+    first = 0
+    for ishard in xrange(nShards):
+        last = first + size + (1 if ishard < extra else 0)
+        shards.append(inputFiles[first:last])
+        first = last
+    return shards
+
+# Backends a Pass runs by itself (the RDataFrame one only fills the seed study, see myMacro.py)
+backends = ['loop', 'columnar']
+
+def checkBackend(backend):
+    if backend not in backends:
+        raise ValueError('backend %s cannot be used here, only %s' % (backend, ' or '.join(backends)))
+
+# TTreeCache size within a memory budget
+def limitCache(cacheSize, maxMemory):
+    if maxMemory is not None and cacheSize > maxMemory/4:
+        print 'Reducing the TTreeCache to %.0f MB to fit in the memory budget' % (maxMemory/4/1e6)
+        return maxMemory/4
+    return cacheSize
+
+# memory budget of each of nWorkers processes
+def workerBudget(maxMemory, nWorkers):
+    return None if maxMemory is None else maxMemory/max(1, nWorkers)
+
+def addHists(target, source):
+    if isinstance(target, (list, tuple)):
+        if len(target) != len(source):
+            raise ValueError('cannot add %d histograms to %d' % (len(source), len(target)))
+        for t, s in zip(target, source):
+            addHists(t, s)
+    else:
+        target.Add(source)
+
+# class names of the histograms of an analysis (possibly in nested lists and tuples)
+def histTypes(hists):
+    if isinstance(hists, (list, tuple)):
+        return sorted(set(name for item in hists for name in histTypes(item)))
+    return [hists.__class__.__name__]
+
+# What saved histograms must match to be added to those of an analysis: its
+# class, the classes of its histograms (TH1- or array-backed) and what its
+# Key() returns (e.g. its cuts), as JSON
+def analysisKey(analysis):
+    key = [analysis.__class__.__name__, histTypes(analysis.hists)]
+    if hasattr(analysis, 'Key'):
+        key.append(analysis.Key())
+    return json.loads(json.dumps(key))
+
+def _runShard(args):
+    analysisTypes, inputFiles, backend, chunkSize, maxMemory = args
+    checkBackend(backend)
+    analyses = [analysisType() for analysisType in analysisTypes]
+    shardPass = Pass(analyses)
+    if backend == 'loop':
+        chain = rt.TChain(columnar.treeName)
+        for inputFile in inputFiles:
+            chain.Add(inputFile)
+        shardPass.Run(chain)
+    else:
+        shardPass.RunColumnar(inputFiles, chunkSize, maxMemory)
+    return [analysis.hists for analysis in analyses], shardPass.branchBytes, shardPass.treeBytes, instrument.timer.Summary()
@@ -0,0 +1,262 @@
+import argparse
+import BaseHTTPServer
+import collections
+import json
+import os
+import shutil
+import tempfile
+import time
+import traceback
+import urlparse
+
+import numpy as np
+
+import histograms, histset, myMacro, skim
+
+# Long-lived query service. The per-electron tables of both studies (see
+# skim.py) are loaded once, optionally memory-mapped, and histogram and
+# efficiency queries are answered over HTTP on localhost:
+#
+#   /query?study=efficiency&variable=pt&bins=25         -> JSON arrays
+#   /plot?study=seeds&variable=eta&category=seedType    -> PNG, drawn as the figures
+#   /stats                                              -> cache statistics
+#
+# Parameters: study (efficiency, seeds), variable (pt, eta), bins, low, high,
+# scale (log, linear: pt only) or edges (comma-separated), category (algo,
+# seedType: seeds only), the cuts of myMacro.defaultCuts (ptThreshold, maxEta,
+# etaCategories), selections of the seed study (seedType, etaCategory, algo:
+# comma-separated indices), interval (clopper-pearson, wilson) and, for plots,
+# logx (0, 1). Filled histograms and rendered plots are kept in LRU caches.
+
+class LRUCache:
+
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self.items = collections.OrderedDict()
+        self.hits = self.misses = 0
+
+    # the value for key, computed with compute() if it is not cached
+    def Get(self, key, compute):
+        if key in self.items:
+            self.hits += 1
+            value = self.items.pop(key)
+        else:
+            self.misses += 1
+            value = compute()
+            while len(self.items) >= self.maxSize:
+                self.items.popitem(last=False)
+        self.items[key] = value
+        return value
+
+    def Stats(self):
+        return {'size' : len(self.items), 'maxSize' : self.maxSize, 'hits' : self.hits, 'misses' : self.misses}
+
+def _floats(text):
+    return tuple(float(value) for value in text.split(','))
+
+def _ints(text):
+    return tuple(int(value) for value in text.split(','))
+
+def _choice(params, name, choices):
+    value = params.get(name, choices[0])
+    if value not in choices:
+        raise ValueError('%s must be one of %s' % (name, ', '.join(choices)))
+    return value
+
+# Normalized query (a hashable tuple of (name, value) pairs) from the string parameters of a request
+def parseQuery(params):
+    study = _choice(params, 'study', ['efficiency', 'seeds'])
+    variable = _choice(params, 'variable', ['pt', 'eta'])
+    if 'edges' in params:
+        edges = _floats(params['edges'])
+    else:
+        bins = int(params.get('bins', 50))
+        scale = _choice(params, 'scale', ['log', 'linear']) if variable == 'pt' else 'linear'
+        ptBinning, etaBinning = myMacro.makeBinnings(bins, bins, scale)
+        binning = ptBinning if variable == 'pt' else etaBinning
+        if 'low' in params or 'high' in params:
+            low, high = float(params.get('low', binning[0])), float(params.get('high', binning[-1]))
+            if scale == 'log' and low <= 0:
+                raise ValueError('log binnings need low > 0')
+            binning = np.logspace(np.log10(low), np.log10(high), bins+1) if scale == 'log' else np.linspace(low, high, bins+1)
+        # otherwise the binnings of the figures, to the last bit
+        edges = tuple(binning)
+    if len(edges) < 2 or (np.diff(edges) <= 0).any():
+        raise ValueError('bin edges must be increasing')
+    cuts = {}
+    for name in ['ptThreshold', 'maxEta']:
+        if name in params:
+            cuts[name] = float(params[name])
+    if 'etaCategories' in params:
+        cuts['etaCategories'] = list(_floats(params['etaCategories']))
+    cuts = myMacro.makeCuts(**cuts)
+    query = [('study', study), ('variable', variable), ('edges', edges),
+             ('ptThreshold', cuts['ptThreshold']), ('maxEta', cuts['maxEta']), ('etaCategories', tuple(cuts['etaCategories']))]
+    if study == 'seeds':
+        query.append(('category', _choice(params, 'category', ['algo', 'seedType'])))
+        for name in ['seedType', 'etaCategory', 'algo']:
+            query.append((name, _ints(params[name]) if name in params else None))
+    return tuple(query)
+
+# ArrayEffHistograms of a query, filled from the electron tables
+def fillQuery(tables, query, name):
+    query = dict(query)
+    variable = query['variable']
+    cuts = myMacro.makeCuts(ptThreshold=query['ptThreshold'], maxEta=query['maxEta'], etaCategories=list(query['etaCategories']))
+    if query['study'] == 'efficiency':
+        columns = myMacro.efficiencyColumns(tables['sims'], cuts)
+        selected = columns['highPt'] if variable == 'eta' else slice(None)
+        hists = histograms.ArrayEffHistograms(name, query['edges'], myMacro.seedNames)
+        hists.FillN(columns[variable][selected], columns['algo'][selected], columns['wgt'][selected])
+        return hists
+    columns = myMacro.seedColumns(tables['seeds'], cuts)
+    selected = columns['highPt'] if variable == 'eta' else np.ones(len(columns['pt']), dtype=bool)
+    for column in ['seedType', 'etaCategory', 'algo']:
+        if query[column] is not None:
+            selected &= np.in1d(columns[column], query[column])
+    category = query['category']
+    labels = myMacro.seedNames if category == 'algo' else myMacro.seedTypes
+    histSet = histset.HistSet(name, [histset.Axis(variable, query['edges']), histset.Axis(category, labels=labels)])
+    histSet.Fill(dict((column, columns[column][selected]) for column in [variable, category]))
+    return histSet.Project(name, variable, category)
+
+# JSON-able arrays of filled histograms (bins include the under- and overflow)
+def queryResult(hists, method):
+    eff = hists.Efficiency()
+    low, high = eff.Interval(method)
+    return {'edges'      : hists.binning.tolist(),
+            'categories' : list(hists.categories),
+            'entries'    : int(hists.allEntries),
+            'total'      : eff.total.tolist(),
+            'passed'     : eff.passed.tolist(),
+            'ratio'      : eff.Ratio().tolist(),
+            'low'        : low.tolist(),
+            'high'       : high.tolist(),
+            'fractions'  : eff.Fractions().tolist()}
+
+class TableService:
+
+    def __init__(self, tables, cacheSize = 256):
+        self.tables = tables
+        self.hists = LRUCache(cacheSize)
+        self.plots = LRUCache(cacheSize)
+        self.plotDir = tempfile.mkdtemp(prefix='service')
+        self.nqueries = 0
+
+    def Hists(self, query):
+        def fill():
+            self.nqueries += 1
+            return fillQuery(self.tables, query, 'query%d' % self.nqueries)
+        return self.hists.Get(query, fill)
+
+    def Query(self, params):
+        method = _choice(params, 'interval', ['clopper-pearson', 'wilson'])
+        return queryResult(self.Hists(parseQuery(params)), method)
+
+    # PNG of the query, drawn like the corresponding figure of myMacro.py; the
+    # x axis is logarithmic for pt binnings starting above 0 unless logx=0
+    def Plot(self, params):
+        query = parseQuery(params)
+        options = dict(query)
+        logx = params.get('logx', '1' if options['variable'] == 'pt' and options['edges'][0] > 0 else '0') == '1'
+        return self.plots.Get((query, logx), lambda: self.Render(query, logx))
+
+    def Render(self, query, logx):
+        options = dict(query)
+        hists = self.Hists(query)
+        if options['study'] == 'efficiency':
+            yTitle = 'Fraction of Simulated GsfElectrons'
+            box, legendColors = ((0.15, 0.49, 0.45, 0.89), None) if options['variable'] == 'pt' else ((0.55, 0.15, 0.85, 0.55), myMacro.colorSeven)
+            colors = myMacro.colorSeven
+        else:
+            yTitle = 'Fraction of Reconstructed GsfElectrons'
+            colors = myMacro.colorSeven if options['category'] == 'algo' else myMacro.colorTwo
+            box, legendColors = ((0.55, 0.15, 0.85, 0.55) if options['category'] == 'algo' else (0.55, 0.15, 0.85, 0.35)), colors
+        xTitle = 'Simulated Transverse Momentum [GeV]' if options['variable'] == 'pt' else 'Simulated Pseudorapidity'
+        plot = myMacro.Plot(os.path.join(self.plotDir, hists.name), hists, ';%s;%s' % (xTitle, yTitle), colors, box, legendColors,
+                            logx = logx, extensions = ('png',))
+        myMacro.renderPlot(plot)
+        path = plot.Outputs()[0]
+        with open(path, 'rb') as image:
+            data = image.read()
+        os.remove(path)
+        return data
+
+    def Stats(self):
+        return {'hists' : self.hists.Stats(), 'plots' : self.plots.Stats(),
+                'electrons' : dict((name, len(table.get('pt', []))) for name, table in self.tables.iteritems())}
+
+    def Close(self):
+        shutil.rmtree(self.plotDir, ignore_errors=True)
+
+class Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse.urlparse(self.path)
+        params = dict((name, values[-1]) for name, values in urlparse.parse_qs(url.query).iteritems())
+        service = self.server.service
+        self.start = time.time()
+        try:
+            if url.path == '/query':
+                self.Reply(200, 'application/json', json.dumps(service.Query(params)))
+            elif url.path == '/plot':
+                self.Reply(200, 'image/png', service.Plot(params))
+            elif url.path == '/stats':
+                self.Reply(200, 'application/json', json.dumps(service.Stats()))
+            else:
+                self.Reply(404, 'text/plain', 'unknown path %s, use /query, /plot or /stats\n' % url.path)
+        except (ValueError, KeyError) as error:
+            self.Reply(400, 'text/plain', '%s\n' % error)
+        except Exception as error:
+            # keep serving: the traceback goes to the log, the error to the client
+            traceback.print_exc()
+            self.Reply(500, 'text/plain', 'internal error: %s\n' % error)
+
+    def Reply(self, status, contentType, body):
+        self.send_response(status)
+        self.send_header('Content-Type', contentType)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    # one line per request, with the time spent answering it (logged when the
+    # status is sent, after the reply was computed)
+    def log_message(self, format, *args):
+        elapsed = ' %.1f ms' % (1000*(time.time() - self.start)) if hasattr(self, 'start') else ''
+        print '%s %s%s' % (self.address_string(), format % args, elapsed)
+
+def loadTables(inputFiles, skimDir, chunkSize = 10000, mmap = False):
+    path = skim.cachePath(inputFiles, skimDir)
+    if not os.path.exists(path):
+        skim.loadOrSkim(inputFiles, skimDir, chunkSize)
+    return skim.mapTables(path) if mmap else skim.readTables(path)
+
+def serve(service, port):
+    server = BaseHTTPServer.HTTPServer(('127.0.0.1', port), Handler)
+    server.service = service
+    print 'Serving on http://127.0.0.1:%d (/query, /plot, /stats)' % port
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.Close()
+
+if __name__ == '__main__':
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--skim-dir', required=True,
+                        help='directory of the electron tables (skimmed on first use, as with myMacro.py --skim-dir)')
+    parser.add_argument('--input-dir', default=myMacro.defaultInputDir)
+    parser.add_argument('--nfiles', type=int, default=myMacro.defaultNFiles)
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--mmap', action='store_true',
+                        help='memory-map the tables instead of reading them into memory')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--cache-size', type=int, default=256,
+                        help='filled histograms and plots kept in the LRU caches')
+    args = parser.parse_args()
+
+    tables = loadTables(myMacro.inputFileList(args.input_dir, args.nfiles), args.skim_dir, args.chunk_size, args.mmap)
+    serve(TableService(tables, args.cache_size), args.port)
@@ -0,0 +1,97 @@
+import hashlib
+import os
+import shutil
+
+import numpy as np
+
+import columnar, scheduler
+
+# Compact per-electron tables, written once per input file list and reused by
+# later runs. Two tables are kept, with the same columns (see
+# columnar.electronColumns): 'seeds' for the reconstructed electrons of
+# analyzeSeeds and 'sims' for the simulated electrons of
+# analyzeECALdrivenEfficiency. Bump skimVersion whenever the columns change.
+
+skimVersion = 1
+tableNames = ['seeds', 'sims']
+
+def cacheKey(inputFiles):
+    digest = hashlib.sha1('skim v%d\n' % skimVersion)
+    for inputFile in inputFiles:
+        digest.update(inputFile + '\n')
+    return digest.hexdigest()
+
+def cachePath(inputFiles, cacheDir):
+    return os.path.join(cacheDir, 'electrons_%s.npz' % cacheKey(inputFiles))
+
+class SkimAnalysis:
+
+    branches = columnar.seedBranches + [branch for branch in columnar.efficiencyBranches if branch not in columnar.seedBranches]
+
+    def __init__(self):
+        self.chunks = dict((name, []) for name in tableNames)
+
+    def FillChunk(self, chunk, tables):
+        self.chunks['seeds'].append(tables.Get('seeds', columnar.selectSeedElectrons))
+        self.chunks['sims'].append(tables.Get('sims', columnar.selectSimElectrons))
+
+    def Tables(self):
+        return dict((name, concatenate(self.chunks[name])) for name in tableNames)
+
+def concatenate(tables):
+    if len(tables) == 0: return {}
+    return dict((column, np.concatenate([table[column] for table in tables])) for column in tables[0])
+
+def writeTables(path, tables):
+    arrays = {}
+    for name, table in tables.iteritems():
+        for column, values in table.iteritems():
+            arrays['%s_%s' % (name, column)] = values
+    # write under a temporary name first, so an interrupted skim never leaves a valid-looking cache
+    with open(path + '.tmp', 'wb') as output:
+        np.savez(output, **arrays)
+    os.rename(path + '.tmp', path)
+
+def readTables(path):
+    tables = dict((name, {}) for name in tableNames)
+    with np.load(path) as arrays:
+        for key in arrays.files:
+            name, column = key.split('_', 1)
+            tables[name][column] = arrays[key]
+    return tables
+
+# The tables of the cache file at path, memory-mapped from .npy copies of its
+# columns (unpacked next to it on first use), so that they are paged in on
+# demand and shared between processes
+def mapTables(path):
+    directory = path[:-len('.npz')]
+    if not os.path.isdir(directory):
+        if os.path.isdir(directory + '.tmp'):
+            shutil.rmtree(directory + '.tmp')
+        os.makedirs(directory + '.tmp')
+        for name, table in readTables(path).iteritems():
+            for column, values in table.iteritems():
+                np.save(os.path.join(directory + '.tmp', '%s_%s.npy' % (name, column)), values)
+        os.rename(directory + '.tmp', directory)
+    tables = dict((name, {}) for name in tableNames)
+    for fileName in sorted(os.listdir(directory)):
+        name, column = fileName[:-len('.npy')].split('_', 1)
+        tables[name][column] = np.load(os.path.join(directory, fileName), mmap_mode='r')
+    return tables
+
+# Tables for this input file list: read from cacheDir if they were skimmed
+# before, otherwise skimmed now with the columnar backend and cached
+def loadOrSkim(inputFiles, cacheDir, chunkSize = 10000):
+    path = cachePath(inputFiles, cacheDir)
+    if os.path.exists(path):
+        print 'Reading electron tables from %s' % path
+        return readTables(path)
+
+    analysis = SkimAnalysis()
+    scheduler.Pass([analysis]).RunColumnar(inputFiles, chunkSize)
+    tables = analysis.Tables()
+    if not os.path.isdir(cacheDir):
+        os.makedirs(cacheDir)
+    writeTables(path, tables)
+    print 'Electron tables written to %s' % path
+    return tables
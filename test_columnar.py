@@ -0,0 +1,102 @@
+import math
+import unittest
+
+import numpy as np
+
+import benchmark, columnar, myMacro
+
+# Equivalence of the columnar kernels with the per-entry loops of the original
+# analyzeSeeds and analyzeECALdrivenEfficiency, on a small synthetic ntuple
+# (see benchmark.py). Neither ROOT nor uproot is needed: the chunk is built
+# from the generated events with columnar.toJagged, and the loops are
+# transcribed with the Math.PxPyPzMVector pt and eta written out.
+
+nEvents = 40
+config = dict(benchmark.defaults, pileup=10)
+
+def generateEvents(seed = 1):
+    rng = np.random.RandomState(seed)
+    return [benchmark.generateEvent(rng, config) for ievent in xrange(nEvents)]
+
+# dict branch -> Jagged, as returned by columnar.iterateChunks
+def makeChunk(events):
+    chunk = {}
+    for branch in benchmark.branchTypes:
+        values = np.empty(len(events), dtype=object)
+        for ievent, event in enumerate(events):
+            values[ievent] = event[branch]
+        chunk[branch] = columnar.toJagged(values)
+    return chunk
+
+def ptEta(px, py, pz):
+    pt = math.sqrt(px*px + py*py)
+    return pt, math.asinh(pz/pt)
+
+# (pt, eta, seedType, algo) of every electron filled by the loop of analyzeSeeds
+def loopSeedElectrons(events):
+    electrons = []
+    for event in events:
+        usedSimIdx = []
+        for seedIdx, simIdxs in zip(event['trk_seedIdx'], event['trk_simTrkIdx']):
+            if len(simIdxs) > 0:
+                if usedSimIdx.count(simIdxs[0]) > 0:
+                    continue
+                if abs(event['sim_pdgId'][simIdxs[0]]) == 11:
+                    usedSimIdx.append(simIdxs[0])
+                    pt, eta = ptEta(event['sim_px'][simIdxs[0]], event['sim_py'][simIdxs[0]], event['sim_pz'][simIdxs[0]])
+                    if event['see_ecalDriven'][seedIdx]:
+                        electrons.append((pt, eta, 0, event['see_algoOriginal'][seedIdx]))
+                    else:
+                        electrons.append((pt, eta, 1, -1))
+    return electrons
+
+# (pt, eta, algo, wgt) of every electron filled by the loop of analyzeECALdrivenEfficiency
+def loopSimElectrons(events):
+    electrons = []
+    for event in events:
+        for trkIdxs, px, py, pz, pdgId, vtxIdx in zip(event['sim_trkIdx'], event['sim_px'], event['sim_py'], event['sim_pz'], event['sim_pdgId'], event['sim_parentVtxIdx']):
+            if abs(pdgId) == 11 and len(event['simvtx_sourceSimIdx'][vtxIdx]) == 0:
+                pt, eta = ptEta(px, py, pz)
+                if abs(eta) > 2.5: continue
+                wgt = 0.
+                algo = 0
+                if len(trkIdxs) > 0:
+                    seedIdx = event['trk_seedIdx'][trkIdxs[0]]
+                    if event['see_ecalDriven'][seedIdx]:
+                        wgt = 1.
+                        algo = event['see_algoOriginal'][seedIdx]
+                electrons.append((pt, eta, algo, wgt))
+    return electrons
+
+class ColumnarTest(unittest.TestCase):
+
+    def setUp(self):
+        self.events = generateEvents()
+        self.chunk = makeChunk(self.events)
+
+    def testSeedElectrons(self):
+        expected = np.array(loopSeedElectrons(self.events))
+        columns = myMacro.seedColumns(columnar.selectSeedElectrons(self.chunk))
+        self.assertGreater(len(expected), 0)
+        self.assertEqual(len(columns['pt']), len(expected))
+        np.testing.assert_allclose(columns['pt'], expected[:,0], rtol=1e-12)
+        np.testing.assert_allclose(columns['eta'], expected[:,1], rtol=1e-12, atol=1e-12)
+        np.testing.assert_array_equal(columns['seedType'], expected[:,2])
+        ecalDriven = columns['seedType'] == 0
+        np.testing.assert_array_equal(columns['algo'][ecalDriven], expected[ecalDriven,3])
+        np.testing.assert_array_equal(columns['highPt'], expected[:,0] > 10.)
+
+    def testSimElectrons(self):
+        expected = np.array(loopSimElectrons(self.events))
+        columns = myMacro.efficiencyColumns(columnar.selectSimElectrons(self.chunk))
+        self.assertGreater(len(expected), 0)
+        self.assertEqual(len(columns['pt']), len(expected))
+        np.testing.assert_allclose(columns['pt'], expected[:,0], rtol=1e-12)
+        np.testing.assert_allclose(columns['eta'], expected[:,1], rtol=1e-12, atol=1e-12)
+        np.testing.assert_array_equal(columns['algo'], expected[:,2])
+        np.testing.assert_array_equal(columns['wgt'], expected[:,3])
+        np.testing.assert_array_equal(columns['highPt'], expected[:,0] > 10)
+
+if __name__ == '__main__':
+
+    unittest.main()
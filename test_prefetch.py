@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+import prefetch
+
+# Staging of input files (see prefetch.py) on a local directory, with the
+# latency of a remote read simulated by prefetch.LatencyReader. The copies must
+# come out in order and unchanged, be removed once the next file is requested,
+# and be read in the background while the previous file is processed.
+
+nFiles = 5
+latency = 0.1
+
+class PrefetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.sourceDir = tempfile.mkdtemp(prefix='source')
+        self.stagingDir = tempfile.mkdtemp(prefix='staging')
+        self.inputFiles = []
+        for ifile in xrange(nFiles):
+            path = os.path.join(self.sourceDir, 'ntuple_%d.root' % ifile)
+            with open(path, 'wb') as output:
+                output.write(os.urandom(1000*(ifile+1)))
+            self.inputFiles.append(path)
+
+    def tearDown(self):
+        shutil.rmtree(self.sourceDir, ignore_errors=True)
+        shutil.rmtree(self.stagingDir, ignore_errors=True)
+
+    def testStagedCopies(self):
+        stager = prefetch.Stager(self.inputFiles, self.stagingDir, depth=2, reader=prefetch.LatencyReader(latency))
+        staged = []
+        for inputFile, localPath in stager:
+            self.assertEqual(os.path.dirname(localPath), self.stagingDir)
+            with open(inputFile, 'rb') as source, open(localPath, 'rb') as copy:
+                self.assertEqual(source.read(), copy.read())
+            staged.append(inputFile)
+            # only the current file and the ones prefetched behind it are on disk
+            self.assertLessEqual(len(os.listdir(self.stagingDir)), 3)
+        self.assertEqual(staged, self.inputFiles)
+        self.assertEqual(os.listdir(self.stagingDir), [])
+
+    def testOverlap(self):
+        stager = prefetch.Stager(self.inputFiles, self.stagingDir, depth=2, reader=prefetch.LatencyReader(latency))
+        start = time.time()
+        for inputFile, localPath in stager:
+            time.sleep(latency)
+        elapsed = time.time() - start
+        # serially nFiles*(latency + latency): only the first read is waited for in full
+        self.assertLess(elapsed, 0.8*2*nFiles*latency)
+
+    def testMissingFile(self):
+        inputFiles = self.inputFiles + [os.path.join(self.sourceDir, 'missing.root')]
+        stager = prefetch.Stager(inputFiles, self.stagingDir, depth=2, reader=prefetch.LatencyReader(0.))
+        with self.assertRaises(IOError):
+            for inputFile, localPath in stager:
+                pass
+
+if __name__ == '__main__':
+
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+
+import numpy as np
+
+import histograms, myMacro, rebinning
+
+# Rebinning of the master histograms (see rebinning.py): the figure binnings
+# merged from a fill with myMacro.masterBinnings must have the contents of a
+# direct fill with the figure binnings, under- and overflow included.
+
+nValues = 20000
+categories = ['a', 'b', 'c']
+
+def fillHists(binning, vals, cats, wgts):
+    hists = histograms.ArrayEffHistograms('test', binning, categories)
+    hists.FillN(vals, cats, wgts)
+    return hists
+
+class RebinningTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = np.random.RandomState(1)
+        self.pt = np.exp(rng.uniform(np.log(0.3), np.log(300.), nValues))
+        self.eta = rng.uniform(-3., 3., nValues)
+        self.cats = rng.randint(len(categories), size=nValues)
+        self.wgts = rng.uniform(0., 2., nValues)
+        self.ptMaster, self.etaMaster = myMacro.masterBinnings()
+
+    def assertRebinned(self, vals, master, binning):
+        direct = fillHists(binning, vals, self.cats, self.wgts)
+        rebinned = fillHists(master, vals, self.cats, self.wgts).Rebin(binning)
+        np.testing.assert_allclose(rebinned.binning, binning, rtol=1e-12)
+        np.testing.assert_array_equal(rebinned.allCounts, direct.allCounts)
+        np.testing.assert_allclose(rebinned.catCounts, direct.catCounts, rtol=1e-12)
+        np.testing.assert_allclose(rebinned.catSumw2, direct.catSumw2, rtol=1e-12)
+
+    def testLogPt(self):
+        for ptBins in [25, 50, 400]:
+            self.assertRebinned(self.pt, self.ptMaster, myMacro.makeBinnings(ptBins, 50, 'log')[0])
+
+    def testLinearPt(self):
+        for ptBins in [40, 80]:
+            self.assertRebinned(self.pt, self.ptMaster, myMacro.makeBinnings(ptBins, 50, 'linear')[0])
+
+    def testEta(self):
+        for etaBins in [10, 50, 400]:
+            self.assertRebinned(self.eta, self.etaMaster, myMacro.makeBinnings(50, etaBins)[1])
+
+    def testForeignEdges(self):
+        with self.assertRaises(ValueError):
+            rebinning.edgeIndices(self.ptMaster, myMacro.makeBinnings(30, 50, 'log')[0])
+
+if __name__ == '__main__':
+
+    unittest.main()